@@ -1,3 +1,5 @@
+import numpy as np
+
 RGB_TO_YIQ = [
     [0.299, 0.587, 0.114],
     [0.596, -0.274, -0.322],
@@ -27,4 +29,21 @@ def convert_rgb_yiq(vec4):
         r = max(0.0, min(1.0, r))
         g = max(0.0, min(1.0, g))
         b = max(0.0, min(1.0, b))
-        return [r, g, b, 0]
\ No newline at end of file
+        return [r, g, b, 0]
+
+def convert_rgb_yiq_array(pixels, out=None):
+    """
+    То же, что convert_rgb_yiq, для массива векторов (..., 4) сразу:
+    по одному матричному умножению на каждое направление. out — массив
+    той же формы для результата (можно сам pixels).
+    """
+    pixels = np.asarray(pixels, dtype=float)
+    if out is None:
+        out = np.empty_like(pixels)
+    to_yiq = np.round(pixels[..., 3]) == 0
+    rgb = pixels[to_yiq, :3]
+    yiq = pixels[~to_yiq, :3]
+    out[to_yiq, :3] = rgb @ np.array(RGB_TO_YIQ).T
+    out[~to_yiq, :3] = np.clip(yiq @ np.array(YIQ_TO_RGB).T, 0.0, 1.0)
+    out[..., 3] = to_yiq
+    return out
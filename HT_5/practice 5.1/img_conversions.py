@@ -90,9 +90,10 @@ class ImageConverter:
 
     @staticmethod
     def color_to_mono(c: ColorImage) -> MonoImage:
-        a = c.data.astype(np.float32)
-        g = ((a[..., 0] + a[..., 1] + a[..., 2]) / 3.0).astype(np.uint8)
-        return MonoImage(g)
+        # целочисленная сумма каналов (не больше 765) без вещественной копии
+        s = c.data.sum(axis=-1, dtype=np.uint16)
+        s //= 3
+        return MonoImage(s.astype(np.uint8))
 
     @staticmethod
     def mono_to_color(m: MonoImage, palette: np.ndarray | None = None) -> ColorImage:
@@ -0,0 +1,118 @@
+"""
+Пакетная обработка изображений пулом процессов.
+
+Каждый процесс-воркер один раз получает анализатор (ObjectAnalysis) и ридер
+изображений, после чего сам читает и анализирует файлы. В основной процесс
+возвращаются только результаты, а не декодированные изображения.
+"""
+import glob
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import structures.image
+
+
+_worker_analyzer = None
+_worker_reader = None
+
+
+def _init_worker(analyzer, reader_ident):
+    global _worker_analyzer, _worker_reader
+    _worker_analyzer = analyzer
+    _worker_reader = structures.image.get_image_reader(reader_ident, pooled=True)
+
+
+def _analyze_chunk(paths):
+    # следующий файл пачки декодируется, пока анализируется текущий
+    return [_worker_analyzer.template_method(image)
+            for _, image in _worker_reader.iter_images(paths)]
+
+
+def _chunks(paths, chunksize):
+    chunk = []
+    for index, path in enumerate(paths):
+        chunk.append((index, path))
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def analyze_many(paths, analyzer, workers=None, ordered=True, chunksize=1,
+                 reader_ident=None, window=4):
+    """
+    Анализ набора файлов в пуле из workers процессов.
+
+    Генератор выдает тройки (index, path, result) по мере готовности:
+    при ordered=True — строго в порядке входных путей,
+    при ordered=False — в порядке завершения.
+    Одновременно в работе держится не больше workers * window пачек
+    по chunksize файлов, поэтому paths может быть и ленивым итератором.
+    reader_ident по умолчанию берется из analyzer.reader_ident.
+    """
+    if reader_ident is None:
+        reader_ident = analyzer.reader_ident
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if chunksize < 1 or window < 1:
+        raise ValueError("chunksize и window должны быть положительными")
+
+    chunks = _chunks(paths, chunksize)
+    limit = workers * window
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(analyzer, reader_ident)) as executor:
+        def submit():
+            chunk = next(chunks, None)
+            if chunk is None:
+                return None
+            future = executor.submit(_analyze_chunk, [path for _, path in chunk])
+            return future, chunk
+
+        if ordered:
+            pending = deque()
+            while True:
+                while len(pending) < limit:
+                    task = submit()
+                    if task is None:
+                        break
+                    pending.append(task)
+                if not pending:
+                    break
+                future, chunk = pending.popleft()
+                for (index, path), result in zip(chunk, future.result()):
+                    yield index, path, result
+        else:
+            pending = {}
+            while True:
+                while len(pending) < limit:
+                    task = submit()
+                    if task is None:
+                        break
+                    pending[task[0]] = task[1]
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk = pending.pop(future)
+                    for (index, path), result in zip(chunk, future.result()):
+                        yield index, path, result
+
+
+def analyze_dir(directory, analyzer, pattern="*.jpg", **kwargs):
+    """
+    Анализ всех файлов каталога, подходящих под шаблон pattern,
+    в лексикографическом порядке имен. Параметры — как у analyze_many.
+    """
+    paths = sorted(glob.glob(os.path.join(directory, pattern)))
+    return analyze_many(paths, analyzer, **kwargs)
+
+
+if __name__ == '__main__':
+    import algorithms.object_analysis
+
+    for index, path, (x, y, w, h, area) in analyze_dir(
+            './data', algorithms.object_analysis.BinaryImage(), workers=2):
+        print(index, path, len(area))
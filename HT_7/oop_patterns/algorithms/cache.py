@@ -0,0 +1,234 @@
+"""
+Кэш результатов анализа на диске с адресацией по содержимому.
+
+Ключ — хэш пикселей изображения вместе с классом анализатора и его
+параметрами (get_params), значение — записи ObjectStats без заголовка
+(сырой массив OBJECT_DTYPE), которые читаются одним np.fromfile.
+"""
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from algorithms.object_analysis import ObjectAnalysis
+from structures.object_stats import OBJECT_DTYPE, ObjectStats
+
+
+class ResultCache:
+    """
+    Каталог с результатами, вытесняемыми по давности использования (LRU),
+    когда превышено число записей max_entries или объем max_bytes.
+    Время последнего использования хранится в mtime файла, поэтому
+    порядок вытеснения переживает перезапуск.
+    Последние memory_entries результатов дополнительно держатся в памяти.
+    """
+
+    SUFFIX = ".rec"
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, max_entries=None,
+                 memory_entries=64):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._max_entries = max_entries
+        self._memory_entries = memory_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._memory = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        for name in os.listdir(directory):
+            if name.endswith(self.SUFFIX):
+                st = os.stat(os.path.join(directory, name))
+                found.append((st.st_mtime, name[:-len(self.SUFFIX)], st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._size += size
+
+    def __getstate__(self):
+        # для передачи в процессы-воркеры (algorithms.batch)
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(image, analyzer):
+        digest = hashlib.sha256()
+        image = np.ascontiguousarray(image)
+        digest.update(("%s|%s|" % (image.dtype.str, image.shape)).encode())
+        digest.update(image.data)
+        cls = type(analyzer)
+        description = {
+            "class": "%s.%s" % (cls.__module__, cls.__qualname__),
+            "params": analyzer.get_params(),
+        }
+        digest.update(json.dumps(description, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + self.SUFFIX)
+
+    def get(self, key):
+        """
+        ObjectStats по ключу или None, если записи нет.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            records = self._memory.get(key)
+            if records is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+        path = self._path(key)
+        if records is not None:
+            # mtime обновляется и при попадании в память, иначе порядок
+            # вытеснения после перезапуска разойдется с настоящим
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return ObjectStats(records)
+        try:
+            records = np.fromfile(path, dtype=OBJECT_DTYPE)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self._size -= self._entries.pop(key, 0)
+                self.misses += 1
+            return None
+        records.flags.writeable = False
+        with self._lock:
+            self.hits += 1
+            self._remember(key, records)
+        return ObjectStats(records)
+
+    def _remember(self, key, records):
+        if self._memory_entries:
+            self._memory[key] = records
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._memory_entries:
+                self._memory.popitem(last=False)
+
+    def put(self, key, objects):
+        path = self._path(key)
+        tmp_path = "%s.%d.%d.tmp" % (path, os.getpid(), threading.get_ident())
+        records = np.array(objects.records, dtype=OBJECT_DTYPE)
+        records.tofile(tmp_path)
+        os.replace(tmp_path, path)
+        size = records.nbytes
+        records.flags.writeable = False
+
+        with self._lock:
+            self._size += size - self._entries.pop(key, 0)
+            self._entries[key] = size
+            self._remember(key, records)
+            while self._entries and (
+                    self._size > self._max_bytes
+                    or (self._max_entries is not None
+                        and len(self._entries) > self._max_entries)):
+                old_key, old_size = self._entries.popitem(last=False)
+                self._size -= old_size
+                self._memory.pop(old_key, None)
+                self.evictions += 1
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        return self._size
+
+    def info(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._size,
+        }
+
+
+class CachedAnalysis(ObjectAnalysis):
+    """
+    Декоратор над ObjectAnalysis: результат template_method берется из
+    ResultCache, если это изображение уже анализировалось тем же классом
+    с теми же параметрами. Побочные атрибуты обернутого объекта
+    (например, hu_moments у FilteredAnalysis) при попадании не обновляются.
+
+    Кэшируется только весь шаблонный метод, поэтому CachedAnalysis —
+    всегда внешний декоратор: CachedAnalysis(FilteredAnalysis(...)).
+    Декоратор поверх него (FilteredAnalysis(CachedAnalysis(...))) вызывал
+    бы шаги по отдельности мимо кэша, поэтому шаги поднимают RuntimeError.
+    """
+    def __init__(self, obj, cache):
+        self._proc = obj
+        self._cache = cache
+
+    @property
+    def reader_ident(self):
+        return self._proc.reader_ident
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def __copy__(self):
+        # кэш общий для всех копий, обернутый объект — свой
+        return CachedAnalysis(copy.copy(self._proc), self._cache)
+
+    def get_params(self):
+        return self._proc.get_params()
+
+    def _outer_only(self):
+        raise RuntimeError("CachedAnalysis должен быть внешним декоратором: "
+                           "CachedAnalysis(%s(...))" % type(self._proc).__name__)
+
+    def noise_filtering(self, image):
+        self._outer_only()
+
+    def segmentation(self, image):
+        self._outer_only()
+
+    def object_parameters(self, data):
+        self._outer_only()
+
+    def template_method(self, image):
+        key = ResultCache.make_key(image, self._proc)
+        objects = self._cache.get(key)
+        if objects is None:
+            objects = self._proc.template_method(image)
+            self._cache.put(key, objects)
+        return objects
+
+
+if __name__ == '__main__':
+    import cv2
+    import tempfile
+    import algorithms.object_analysis
+
+    image = cv2.imread('./data/1.jpg', cv2.IMREAD_GRAYSCALE)
+    cached = CachedAnalysis(algorithms.object_analysis.BinaryImage(),
+                            ResultCache(tempfile.mkdtemp()))
+    for _ in range(3):
+        cached.template_method(image)
+    print(cached.cache.info())
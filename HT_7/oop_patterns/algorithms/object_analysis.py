@@ -1,11 +1,20 @@
 """
 Шаблонный метод (Template method)
 """
+import copy
+
 import cv2
 import numpy as np
 
+from algorithms.watershed import raster_order, tiled_watershed_components, watershed_mask
+from structures.object_stats import ObjectStats
+
 
 class ObjectAnalysis(object):
+    # идентификатор ридера из structures.image.get_image_reader,
+    # которым читаются изображения для этого анализатора
+    reader_ident = 1
+
     def template_method(self, image):
         """
         Базовая реализация шаблонного метода:
@@ -18,6 +27,13 @@ class ObjectAnalysis(object):
         data = self.object_parameters(data)
         return data
 
+    def get_params(self):
+        """
+        Параметры, от которых зависит результат template_method
+        (используются, например, как часть ключа кэша результатов).
+        """
+        return {}
+
     def noise_filtering(self, image):
         raise NotImplementedError()
 
@@ -27,23 +43,12 @@ class ObjectAnalysis(object):
     def object_parameters(self, data):
         """
         Ожидается, что data = (image, (numLabels, labels, stats, centroids))
-        Возвращаются списки x, y, w, h, area для всех объектов, кроме фона.
+        Возвращается ObjectStats для всех объектов, кроме фона;
+        распаковывается как (x, y, w, h, area).
         """
         (image, data) = data
         (numLabels, labels, stats, centroids) = data
-        x = []
-        y = []
-        w = []
-        h = []
-        area = []
-        for i in range(1, numLabels):
-            x.append(stats[i, cv2.CC_STAT_LEFT])
-            y.append(stats[i, cv2.CC_STAT_TOP])
-            w.append(stats[i, cv2.CC_STAT_WIDTH])
-            h.append(stats[i, cv2.CC_STAT_HEIGHT])
-            area.append(stats[i, cv2.CC_STAT_AREA])
-
-        return (x, y, w, h, area)
+        return ObjectStats.from_components(stats, centroids)
 
 
 class BinaryImage(ObjectAnalysis):
@@ -52,6 +57,8 @@ class BinaryImage(ObjectAnalysis):
     - шум режем медианным фильтром
     - сегментация по связным компонентам
     """
+    reader_ident = 0
+
     def __init__(self):
         pass
 
@@ -76,6 +83,8 @@ class MonochromeImage(BinaryImage):
       2) Canny
       3) object_parameters из базового класса
     """
+    reader_ident = 1
+
     def __init__(self):
         pass
 
@@ -103,36 +112,47 @@ class ColorImage(MonochromeImage):
       3) distance transform
       4) watershed
       5) параметры объектов по результату watershed
+
+    При заданном tile_size изображение обрабатывается по тайлам с
+    перекрытием overlap (см. tiled_watershed_components): пиковая память
+    ограничена размером тайла, а сегментация возвращает (None, output)
+    без маски и карты меток.
+    В обоих режимах объекты нумеруются по первому пикселю в порядке
+    развертки (см. watershed.raster_order), поэтому метки совпадают.
     """
-    def __init__(self):
-        pass
+    reader_ident = 2
+
+    def __init__(self, tile_size=None, overlap=64):
+        self._tile_size = tile_size
+        self._overlap = overlap
+
+    def get_params(self):
+        if self._tile_size is None:
+            return {}
+        return {"tile_size": self._tile_size, "overlap": self._overlap}
+
+    def noise_filtering(self, image):
+        if self._tile_size is None:
+            return super().noise_filtering(image)
+        # в режиме тайлов шум подавляется в segmentation по каждому тайлу
+        return image
 
     def segmentation(self, image):
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        gray_blur = cv2.GaussianBlur(gray, (5, 5), 0)
-        _, thresh = cv2.threshold(
-            gray_blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU
-        )
-        kernel = np.ones((3, 3), np.uint8)
-        opening = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel, iterations=2)
-        sure_bg = cv2.dilate(opening, kernel, iterations=3)
-        dist_transform = cv2.distanceTransform(opening, cv2.DIST_L2, 5)
-        _, sure_fg = cv2.threshold(
-            dist_transform, 0.7 * dist_transform.max(), 255, 0
-        )
-        sure_fg = np.uint8(sure_fg)
-        unknown = cv2.subtract(sure_bg, sure_fg)
-        numLabels, markers = cv2.connectedComponents(sure_fg)
-        markers = markers + 1
-        markers[unknown == 255] = 0
-        markers = cv2.watershed(image, markers)
-        mask = np.uint8(markers > 1) * 255
+        if self._tile_size is not None:
+            output = tiled_watershed_components(
+                image,
+                self._tile_size,
+                self._overlap,
+                prefilter=super().noise_filtering,
+            )
+            return (None, output)
+        mask = watershed_mask(image)
         output = cv2.connectedComponentsWithStats(
             mask,
             4,
             cv2.CV_32S,
         )
-        return (mask, output)
+        return (mask, raster_order(output))
 
 
 """
@@ -145,45 +165,66 @@ class FilteredAnalysis(ObjectAnalysis):
     Декоратор над ObjectAnalysis.
     - фильтрует объекты по площади
     - дополнительно считает Hu-моменты и сохраняет их в self.hu_moments
+
+    Шаги шаблонного метода делегируются обернутому объекту, поэтому
+    подавление шума и сегментация выполняются один раз, а Hu-моменты
+    считаются по той же карте меток.
     """
-    def __init__(self, obj):
+    def __init__(self, obj, min_area=10, max_area=2500):
         self._proc = obj
+        self._min_area = min_area
+        self._max_area = max_area
         self.hu_moments = None
 
-    def template_method(self, image):
-        (_x, _y, _w, _h, _area) = self._proc.template_method(image)
-
-        x = []
-        y = []
-        w = []
-        h = []
-        area = []
-
-        for i in range(len(_area)):
-            if 10 < _area[i] < 2500:
-                x.append(_x[i])
-                y.append(_y[i])
-                w.append(_w[i])
-                h.append(_h[i])
-                area.append(_area[i])
-
-        try:
-            processed = self._proc.noise_filtering(image)
-            (seg_image, seg_data) = self._proc.segmentation(processed)
-            (numLabels, labels, stats, centroids) = seg_data
-
-            hu_list = []
-            for i in range(1, numLabels):
-                if 10 < stats[i, cv2.CC_STAT_AREA] < 2500:
-                    mask = (labels == i).astype("uint8")
-                    m = cv2.moments(mask)
-                    hu = cv2.HuMoments(m)
-                    hu_list.append(hu)
-            self.hu_moments = hu_list
-        except Exception:
-            self.hu_moments = None
-
-        return (x, y, w, h, area)
+    @property
+    def reader_ident(self):
+        return self._proc.reader_ident
+
+    def get_params(self):
+        return {
+            "proc": type(self._proc).__qualname__,
+            "proc_params": self._proc.get_params(),
+            "min_area": self._min_area,
+            "max_area": self._max_area,
+        }
+
+    def __copy__(self):
+        # обернутый объект копируется тоже: у копии свое состояние прогона
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone._proc = copy.copy(self._proc)
+        clone.hu_moments = None
+        return clone
+
+    def noise_filtering(self, image):
+        return self._proc.noise_filtering(image)
+
+    def segmentation(self, image):
+        return self._proc.segmentation(image)
+
+    def object_parameters(self, data):
+        objects = self._proc.object_parameters(data)
+        objects = objects.filter_area(self._min_area, self._max_area)
+        (seg_image, (numLabels, labels, stats, centroids)) = data
+        self.hu_moments = self.hu_moments_of(labels, objects)
+        return objects
+
+    @staticmethod
+    def hu_moments_of(labels, objects):
+        """
+        Hu-моменты объектов. Маска каждого объекта строится только
+        в пределах его ограничивающего прямоугольника: Hu-моменты
+        инвариантны к сдвигу, поэтому результат совпадает с полнокадровым.
+        """
+        if labels is None:
+            return None
+        hu_list = []
+        for label, x, y, w, h in zip(objects["label"], objects["x"], objects["y"],
+                                     objects["w"], objects["h"]):
+            roi = labels[y:y + h, x:x + w]
+            mask = (roi == label).view(np.uint8)
+            hu_list.append(cv2.HuMoments(cv2.moments(mask)))
+        return hu_list
 
 
 if __name__ == '__main__':
@@ -0,0 +1,205 @@
+"""
+Конфигурируемый конвейер стадий для шаблонного метода.
+
+Последовательность шагов noise_filtering -> segmentation и их параметры
+задаются описанием (словарем или JSON-файлом), а не подклассом:
+
+    {
+        "reader": 1,
+        "noise_filtering": [{"stage": "gaussian", "ksize": 5}],
+        "segmentation": [{"stage": "canny", "low": 100, "high": 200},
+                         {"stage": "connected_components", "connectivity": 8}],
+        "filter": {"min_area": 10, "max_area": 2500}
+    }
+
+Описание проверяется один раз при создании PipelineAnalysis и
+компилируется в список вызовов. Каждая стадия пишет результат в свой
+буфер, который переиспользуется на следующих кадрах того же размера.
+"""
+import functools
+import inspect
+import json
+
+import cv2
+
+from algorithms.object_analysis import ObjectAnalysis
+from algorithms.watershed import watershed_mask
+
+
+def _median(image, dst, ksize=5):
+    return cv2.medianBlur(image, ksize, dst)
+
+
+def _gaussian(image, dst, ksize=5, sigma=0):
+    return cv2.GaussianBlur(image, (ksize, ksize), sigma, dst)
+
+
+def _canny(image, dst, low=100, high=200):
+    return cv2.Canny(image, low, high, dst)
+
+
+def _otsu(image, dst):
+    _, binary = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst)
+    return binary
+
+
+def _watershed(image, dst, open_iterations=2, dilate_iterations=3, fg_ratio=0.7):
+    return watershed_mask(image, open_iterations, dilate_iterations, fg_ratio)
+
+
+def _connected_components(image, dst, connectivity=4):
+    output = cv2.connectedComponentsWithStats(
+        image,
+        labels=dst,
+        connectivity=connectivity,
+        ltype=cv2.CV_32S,
+    )
+    return (image, output)
+
+
+# имя стадии -> (функция, шаг шаблонного метода, в котором она допустима)
+STAGES = {
+    "median": (_median, "noise_filtering"),
+    "gaussian": (_gaussian, "noise_filtering"),
+    "canny": (_canny, "segmentation"),
+    "otsu": (_otsu, "segmentation"),
+    "watershed": (_watershed, "segmentation"),
+    "connected_components": (_connected_components, "segmentation"),
+}
+
+# стадия, которой обязана заканчиваться сегментация
+TERMINAL_STAGE = "connected_components"
+
+# описания, повторяющие BinaryImage, MonochromeImage и ColorImage.
+# Классы передают 4 в connectedComponentsWithStats позиционно, и оно попадает
+# в аргумент labels, а не connectivity, поэтому фактически используется 8.
+PRESETS = {
+    "binary": {
+        "reader": 0,
+        "noise_filtering": [{"stage": "median", "ksize": 5}],
+        "segmentation": [{"stage": "connected_components", "connectivity": 8}],
+    },
+    "monochrome": {
+        "reader": 1,
+        "noise_filtering": [{"stage": "gaussian", "ksize": 5}],
+        "segmentation": [{"stage": "canny", "low": 100, "high": 200},
+                         {"stage": "connected_components", "connectivity": 8}],
+    },
+    "color": {
+        "reader": 2,
+        "noise_filtering": [{"stage": "gaussian", "ksize": 5}],
+        "segmentation": [{"stage": "watershed"},
+                         {"stage": "connected_components", "connectivity": 8}],
+    },
+}
+
+
+def _compile_step(step, specs):
+    """
+    Проверка описания одного шага и превращение его в список
+    функций с уже подставленными параметрами.
+    """
+    if not isinstance(specs, list):
+        raise ValueError("Шаг %s должен быть списком стадий" % step)
+    compiled = []
+    for position, spec in enumerate(specs):
+        spec = dict(spec)
+        name = spec.pop("stage", None)
+        if name not in STAGES:
+            raise ValueError("Неизвестная стадия %r в шаге %s" % (name, step))
+        func, allowed_step = STAGES[name]
+        if allowed_step != step:
+            raise ValueError("Стадия %s недопустима в шаге %s" % (name, step))
+        if name == TERMINAL_STAGE and position != len(specs) - 1:
+            raise ValueError("Стадия %s должна быть последней" % name)
+        try:
+            inspect.signature(func).bind(None, None, **spec)
+        except TypeError as e:
+            raise ValueError("Неверные параметры стадии %s: %s" % (name, e))
+        compiled.append(functools.partial(func, **spec))
+    return compiled
+
+
+class PipelineAnalysis(ObjectAnalysis):
+    """
+    Шаблонный метод, шаги которого собраны из описания конвейера.
+    Результаты промежуточных стадий лежат в буферах объекта и
+    перезаписываются следующим вызовом template_method.
+    """
+
+    def __init__(self, config):
+        segmentation = config.get("segmentation")
+        if not segmentation or segmentation[-1].get("stage") != TERMINAL_STAGE:
+            raise ValueError("Сегментация должна заканчиваться стадией %s" % TERMINAL_STAGE)
+        unknown = set(config) - {"reader", "noise_filtering", "segmentation", "filter"}
+        if unknown:
+            raise ValueError("Неизвестные разделы описания: %s" % ", ".join(sorted(unknown)))
+
+        self.config = config
+        self.reader_ident = config.get("reader", ObjectAnalysis.reader_ident)
+        self._noise_filtering = _compile_step("noise_filtering",
+                                              config.get("noise_filtering", []))
+        self._segmentation = _compile_step("segmentation", segmentation)
+        area = config.get("filter")
+        self._area = None if area is None else (area["min_area"], area["max_area"])
+        self._buffers = [None] * (len(self._noise_filtering) + len(self._segmentation))
+
+    def __copy__(self):
+        """
+        Копия делит с оригиналом описание и скомпилированные стадии,
+        но получает свои (пустые) буферы.
+        """
+        clone = self.__class__.__new__(self.__class__)
+        clone.__dict__.update(self.__dict__)
+        clone._buffers = [None] * len(self._buffers)
+        return clone
+
+    @classmethod
+    def from_file(cls, file_path):
+        with open(file_path, "r") as file:
+            return cls(json.load(file))
+
+    @classmethod
+    def from_preset(cls, name, **overrides):
+        """
+        Готовое описание из PRESETS; overrides заменяют его разделы целиком.
+        """
+        if name not in PRESETS:
+            raise ValueError("Неизвестная заготовка конвейера: %s" % name)
+        config = dict(PRESETS[name])
+        config.update(overrides)
+        return cls(config)
+
+    def get_params(self):
+        return self.config
+
+    def _run(self, stages, offset, data):
+        buffers = self._buffers
+        for index, stage in enumerate(stages, offset):
+            data = stage(data, buffers[index])
+            if isinstance(data, tuple):
+                buffers[index] = data[1][1]
+            else:
+                buffers[index] = data
+        return data
+
+    def noise_filtering(self, image):
+        return self._run(self._noise_filtering, 0, image)
+
+    def segmentation(self, image):
+        return self._run(self._segmentation, len(self._noise_filtering), image)
+
+    def object_parameters(self, data):
+        objects = super().object_parameters(data)
+        if self._area is not None:
+            objects = objects.filter_area(*self._area)
+        return objects
+
+
+if __name__ == '__main__':
+    analysis = PipelineAnalysis.from_preset("monochrome",
+                                            filter={"min_area": 10, "max_area": 2500})
+    image = cv2.imread('./data/1.jpg', cv2.IMREAD_GRAYSCALE)
+    (x, y, w, h, area) = analysis.template_method(image)
+    for i in range(len(area)):
+        print([x[i], y[i], w[i], h[i], area[i]])
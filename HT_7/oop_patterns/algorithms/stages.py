@@ -1,6 +1,10 @@
 """
 Состояние (State)
 """
+import math
+import threading
+import time
+
 
 class IPStage():
     def get_stage(self):
@@ -26,22 +30,176 @@ class ProcessingSteps(object):
     def __init__(self):
         self._current_state = None
         self._states = self.get_states()
+        # следующее состояние ищется по словарю, а не перебором списка
+        self._next = {state: self._states[(i + 1) % len(self._states)]
+                      for i, state in enumerate(self._states)}
 
     def get_states(self):
         return [LoadedIPState(), ProcessingIPState(), FinishedIPState()]
 
+    def first_state(self):
+        return self._states[0]
+
+    def following(self, state):
+        return self._next[state]
+
     def next_state(self):
         if self._current_state is None:
             self._current_state = self._states[0]
         else:
-            index = (self._states.index(self._current_state) + 1) % len(self._states)
-            self._current_state = self._states[index]
+            self._current_state = self._next[self._current_state]
         return self._current_state
 
     def info(self):
         state = self.next_state().get_stage()
         return state
 
+
+class LatencyHistogram(object):
+    """
+    Гистограмма длительностей с логарифмическими корзинами: добавление
+    за O(1) и фиксированная память, квантили — с относительной
+    погрешностью не больше (growth - 1).
+    Корзина 0 — все, что меньше low, корзина i > 0 охватывает
+    [low * growth^(i - 1), low * growth^i).
+    """
+    def __init__(self, low=1e-6, high=1e3, growth=1.05):
+        self._low = low
+        self._log_growth = math.log(growth)
+        self._growth = growth
+        self._counts = [0] * (int(math.log(high / low) / self._log_growth) + 2)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds < self._low:
+            index = 0
+        else:
+            index = min(int(math.log(seconds / self._low) / self._log_growth) + 1,
+                        len(self._counts) - 1)
+        self._counts[index] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """
+        Оценка q-квантиля (0 <= q <= 1) — середина (геометрическая)
+        корзины, в которую он попадает.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen > rank:
+                if index == 0:
+                    return self._low
+                value = self._low * self._growth ** (index - 0.5)
+                return min(value, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class JobTracker(object):
+    """
+    Отслеживание жизненного цикла многих заданий (например, кадров)
+    по состояниям ProcessingSteps.
+
+    start(job) переводит задание в первое состояние, advance(job) — в
+    следующее; каждый переход отмечается монотонными часами, а время,
+    проведенное в покинутом состоянии, попадает в гистограмму этого
+    состояния. С приходом в последнее состояние задание завершается,
+    и его полное время попадает в гистограмму "total".
+    Все операции — O(1); безопасно для вызова из нескольких потоков.
+    """
+    TOTAL = "total"
+
+    def __init__(self, steps=None, clock=time.perf_counter):
+        self._steps = steps or ProcessingSteps()
+        self._final = self._last_state()
+        self._clock = clock
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self.histograms = {}
+
+    def _last_state(self):
+        state = self._steps.first_state()
+        while self._steps.following(state) is not self._steps.first_state():
+            state = self._steps.following(state)
+        return state
+
+    def _histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        return histogram
+
+    def start(self, job):
+        now = self._clock()
+        with self._lock:
+            if job in self._jobs:
+                raise ValueError("Задание %r уже отслеживается" % (job,))
+            self._jobs[job] = (self._steps.first_state(), now, now)
+
+    def advance(self, job):
+        """
+        Переход задания в следующее состояние; возвращает это состояние.
+        """
+        now = self._clock()
+        with self._lock:
+            if job not in self._jobs:
+                raise ValueError("Задание %r не отслеживается" % (job,))
+            (state, entered, started) = self._jobs[job]
+            self._histogram(state.get_stage()).add(now - entered)
+            state = self._steps.following(state)
+            if state is self._final:
+                del self._jobs[job]
+                self._histogram(self.TOTAL).add(now - started)
+            else:
+                self._jobs[job] = (state, now, started)
+        return state
+
+    def discard(self, job):
+        """
+        Снятие незавершенного задания без записи времени.
+        """
+        with self._lock:
+            self._jobs.pop(job, None)
+
+    def state_of(self, job):
+        with self._lock:
+            entry = self._jobs.get(job)
+        return None if entry is None else entry[0]
+
+    @property
+    def active(self):
+        return len(self._jobs)
+
+    def export(self):
+        """
+        {состояние: {count, mean, p50, p95, p99, max}} в секундах.
+        """
+        with self._lock:
+            return {name: histogram.summary() for name, histogram in self.histograms.items()}
+
+
 if __name__== '__main__':
 
     proc_stage = ProcessingSteps()
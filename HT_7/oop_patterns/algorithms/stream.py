@@ -0,0 +1,239 @@
+"""
+Потоковый анализ последовательности кадров (видео, каталог снимков
+или стопка несжатых кадров).
+
+Декодирование кадра N+1 идет в фоновом потоке одновременно с анализом
+кадра N. Кадры читаются в кольцо заранее выделенных буферов, которые
+переиспользуются от кадра к кадру, а результаты выдаются генератором,
+поэтому длинная запись целиком в памяти не держится.
+"""
+import glob
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+from structures.image import RawFrameReader, read_image_file
+
+
+class FrameSource:
+    """
+    Источник кадров: read(buf) возвращает очередной кадр BGR,
+    по возможности записанный в buf, или None в конце.
+    """
+    def read(self, buf):
+        raise NotImplementedError()
+
+    def close(self):
+        pass
+
+
+class VideoSource(FrameSource):
+    def __init__(self, path):
+        self._capture = cv2.VideoCapture(path)
+        if not self._capture.isOpened():
+            raise RuntimeError(f"Не удалось открыть видео {path}")
+
+    def read(self, buf):
+        ok, frame = self._capture.read(buf)
+        return frame if ok else None
+
+    def close(self):
+        self._capture.release()
+
+
+class ImageSequenceSource(FrameSource):
+    """
+    Кадры — файлы каталога, подходящие под pattern, по порядку имен.
+    """
+    def __init__(self, directory, pattern="*.jpg"):
+        self._paths = iter(sorted(glob.glob(os.path.join(directory, pattern))))
+
+    def read(self, buf):
+        path = next(self._paths, None)
+        if path is None:
+            return None
+        # неудачное декодирование — RuntimeError, а не прошлый кадр в buf
+        return read_image_file(path, cv2.IMREAD_COLOR, buf)
+
+
+class StackSource(FrameSource):
+    """
+    Кадры стопки .npy/.raw (structures.image.RawFrameReader): виды
+    np.memmap без копирования, серые или BGR — как лежат в файле.
+    """
+    def __init__(self, path, frame_shape=None):
+        self._frames = iter(RawFrameReader(2, frame_shape).open_stack(path))
+
+    def read(self, buf):
+        return next(self._frames, None)
+
+
+class StreamStats:
+    """
+    Накопленная статистика потока: без хранения значений по кадрам.
+    """
+    def __init__(self):
+        self.frames = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.last_latency = 0.0
+        self._started = None
+        self._finished = None
+
+    def add(self, latency):
+        if self._started is None:
+            self._started = time.perf_counter() - latency
+        self.frames += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+        self.last_latency = latency
+        self._finished = time.perf_counter()
+
+    @property
+    def mean_latency(self):
+        return self.total_latency / self.frames if self.frames else 0.0
+
+    @property
+    def fps(self):
+        """
+        Устойчивая частота кадров: кадры / время от начала первого
+        анализа до конца последнего.
+        """
+        if not self.frames or self._finished == self._started:
+            return 0.0
+        return self.frames / (self._finished - self._started)
+
+    def __repr__(self):
+        return "StreamStats(frames=%d, mean=%.2f ms, max=%.2f ms, fps=%.1f)" % (
+            self.frames, self.mean_latency * 1000, self.max_latency * 1000, self.fps)
+
+
+class _Slot:
+    """
+    Буферы одного кадра: исходный BGR и, при необходимости, серый;
+    job — номер кадра для JobTracker.
+    """
+    def __init__(self):
+        self.frame = None
+        self.gray = None
+        self.job = None
+
+
+_END = object()
+
+
+class StreamAnalysis:
+    """
+    Потоковый анализатор поверх ObjectAnalysis.
+    Кадр приводится к виду, который ждет analyzer (reader_ident):
+    0 — бинарный по Оцу, 1 — серый, 2 — цветной.
+    tracker (algorithms.stages.JobTracker) получает каждый кадр как
+    задание: Init — чтение, подготовка и ожидание в очереди,
+    Processing — template_method.
+    """
+    def __init__(self, analyzer, prefetch=2, tracker=None):
+        if prefetch < 1:
+            raise ValueError("prefetch должен быть положительным")
+        self._analyzer = analyzer
+        self._prefetch = prefetch
+        self._tracker = tracker
+        self.stats = StreamStats()
+
+    def _prepare(self, slot):
+        ident = self._analyzer.reader_ident
+        if slot.frame.ndim == 2:
+            # серый кадр (например, из StackSource)
+            if ident == 2:
+                slot.gray = cv2.cvtColor(slot.frame, cv2.COLOR_GRAY2BGR, slot.gray)
+                return slot.gray
+            if ident == 1:
+                return slot.frame
+            if slot.gray is None or slot.gray.shape != slot.frame.shape:
+                slot.gray = slot.frame.copy()
+            cv2.threshold(slot.frame, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, slot.gray)
+            return slot.gray
+        if ident == 2:
+            return slot.frame
+        slot.gray = cv2.cvtColor(slot.frame, cv2.COLOR_BGR2GRAY, slot.gray)
+        if ident == 0:
+            cv2.threshold(slot.gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, slot.gray)
+        return slot.gray
+
+    def _decode(self, source, free, ready, stop):
+        tracker = self._tracker
+        index = 0
+        try:
+            while not stop.is_set():
+                try:
+                    slot = free.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if tracker is not None:
+                    slot.job = (id(self), index)
+                    tracker.start(slot.job)
+                frame = source.read(slot.frame)
+                if frame is None:
+                    if tracker is not None:
+                        tracker.discard(slot.job)
+                    break
+                index += 1
+                slot.frame = frame
+                ready.put((slot, self._prepare(slot)))
+            ready.put((_END, None))
+        except Exception as e:
+            ready.put((_END, e))
+
+    def run(self, source):
+        """
+        Генератор (index, objects, latency) по кадрам источника;
+        latency — время анализа кадра в секундах.
+        """
+        free = queue.Queue()
+        for _ in range(self._prefetch + 1):
+            free.put(_Slot())
+        ready = queue.Queue(maxsize=self._prefetch)
+        stop = threading.Event()
+        decoder = threading.Thread(target=self._decode,
+                                   args=(source, free, ready, stop), daemon=True)
+        decoder.start()
+        index = 0
+        try:
+            while True:
+                slot, image = ready.get()
+                if slot is _END:
+                    if image is not None:
+                        raise image
+                    break
+                if self._tracker is not None:
+                    self._tracker.advance(slot.job)
+                started = time.perf_counter()
+                objects = self._analyzer.template_method(image)
+                latency = time.perf_counter() - started
+                if self._tracker is not None:
+                    self._tracker.advance(slot.job)
+                free.put(slot)
+                self.stats.add(latency)
+                yield index, objects, latency
+                index += 1
+        finally:
+            stop.set()
+            while decoder.is_alive():
+                try:
+                    slot, _ = ready.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if self._tracker is not None and slot is not _END:
+                    self._tracker.discard(slot.job)
+            source.close()
+
+
+if __name__ == '__main__':
+    import algorithms.object_analysis
+
+    stream = StreamAnalysis(algorithms.object_analysis.BinaryImage())
+    for index, (x, y, w, h, area), latency in stream.run(ImageSequenceSource('./data')):
+        print(index, len(area), "%.2f ms" % (latency * 1000))
+    print(stream.stats)
@@ -0,0 +1,302 @@
+"""
+Сегментация цветных изображений по алгоритму watershed,
+в том числе по тайлам для очень больших изображений.
+"""
+import cv2
+import numpy as np
+
+
+_KERNEL = np.ones((3, 3), np.uint8)
+
+
+def _blurred_gray(image):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.GaussianBlur(gray, (5, 5), 0)
+
+
+def _opening(gray_blur, threshold, open_iterations):
+    if threshold is None:
+        _, thresh = cv2.threshold(
+            gray_blur, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU
+        )
+    else:
+        _, thresh = cv2.threshold(gray_blur, threshold, 255, cv2.THRESH_BINARY)
+    return cv2.morphologyEx(thresh, cv2.MORPH_OPEN, _KERNEL,
+                            iterations=open_iterations)
+
+
+def otsu_threshold(hist):
+    """
+    Порог Оцу по гистограмме из 256 значений — так же, как его выбирает
+    cv2.threshold с THRESH_OTSU для 8-битного изображения.
+    """
+    p = np.asarray(hist, dtype=np.float64)
+    p = p / p.sum()
+    i = np.arange(256, dtype=np.float64)
+    q1 = np.cumsum(p)
+    q2 = 1.0 - q1
+    mu = np.cumsum(i * p)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mu1 = mu / q1
+        mu2 = (mu[-1] - mu) / q2
+        sigma = q1 * q2 * (mu1 - mu2) ** 2
+    eps = np.finfo(np.float32).eps
+    valid = (np.minimum(q1, q2) >= eps) & (np.maximum(q1, q2) <= 1.0 - eps)
+    if not valid.any():
+        return 0
+    sigma = np.where(valid, sigma, -1.0)
+    return int(np.argmax(sigma))
+
+
+def watershed_mask(image, open_iterations=2, dilate_iterations=3, fg_ratio=0.7,
+                   threshold=None, max_dist=None):
+    """
+    Маска объектов цветного (BGR) изображения по алгоритму watershed:
+    бинаризация Оцу, морфологическое открытие, distance transform
+    и разметка маркеров. Объекты — 255, фон и границы — 0.
+
+    threshold и max_dist по умолчанию считаются по самому изображению;
+    при обработке по тайлам передаются значения для всего изображения.
+    """
+    opening = _opening(_blurred_gray(image), threshold, open_iterations)
+    sure_bg = cv2.dilate(opening, _KERNEL, iterations=dilate_iterations)
+    dist_transform = cv2.distanceTransform(opening, cv2.DIST_L2, 5)
+    if max_dist is None:
+        max_dist = dist_transform.max()
+    _, sure_fg = cv2.threshold(
+        dist_transform, fg_ratio * max_dist, 255, 0
+    )
+    sure_fg = np.uint8(sure_fg)
+    unknown = cv2.subtract(sure_bg, sure_fg)
+    numLabels, markers = cv2.connectedComponents(sure_fg)
+    markers = markers + 1
+    markers[unknown == 255] = 0
+    markers = cv2.watershed(image, markers)
+    return np.uint8(markers > 1) * 255
+
+
+def _first_pixels(labels, stats, width, y0=0, x0=0):
+    """
+    Номер (y * width + x) первого в порядке развертки пикселя каждой
+    компоненты, кроме фона. labels — карта меток куска со сдвигом (y0, x0)
+    в изображении ширины width, stats — уже в координатах изображения.
+    Первый пиксель лежит в верхней строке прямоугольника компоненты,
+    поэтому просматриваются только такие строки.
+    """
+    n = len(stats)
+    first = np.empty(n - 1, dtype=np.int64)
+    tops = stats[1:, cv2.CC_STAT_TOP] - y0
+    for row in np.unique(tops):
+        found, index = np.unique(labels[row], return_index=True)
+        position = np.empty(n, dtype=np.int64)
+        position[found] = index
+        pieces = np.nonzero(tops == row)[0]
+        first[pieces] = (row + y0) * width + position[pieces + 1] + x0
+    return first
+
+
+def raster_order(output):
+    """
+    Результат cv2.connectedComponentsWithStats, в котором компоненты
+    перенумерованы по первому пикселю в порядке развертки (сверху вниз,
+    слева направо); карта меток перенумеровывается тоже.
+    OpenCV нумерует компоненты в порядке своего блочного обхода, а не
+    развертки; tiled_watershed_components нумерует так же, как эта
+    функция, поэтому обе сегментации ColorImage дают один порядок.
+    """
+    (n, labels, stats, centroids) = output
+    if n <= 2:
+        return output
+    order = np.argsort(_first_pixels(labels, stats, labels.shape[1]), kind="stable")
+    lut = np.empty(n, dtype=labels.dtype)
+    lut[0] = 0
+    lut[order + 1] = np.arange(1, n, dtype=labels.dtype)
+    index = np.concatenate(([0], order + 1))
+    return (n, lut[labels], stats[index], centroids[index])
+
+
+def _tiles(height, width, tile_size, overlap):
+    """
+    Тайлы по строкам: (ty, tx, ядро (y0, y1, x0, x1), тайл с перекрытием).
+    """
+    for ty, y0 in enumerate(range(0, height, tile_size)):
+        y1 = min(y0 + tile_size, height)
+        for tx, x0 in enumerate(range(0, width, tile_size)):
+            x1 = min(x0 + tile_size, width)
+            yield (ty, tx, (y0, y1, x0, x1),
+                   (max(0, y0 - overlap), min(height, y1 + overlap),
+                    max(0, x0 - overlap), min(width, x1 + overlap)))
+
+
+def _find(parent, i):
+    root = i
+    while parent[root] != root:
+        root = parent[root]
+    while parent[i] != root:
+        parent[i], i = root, parent[i]
+    return root
+
+
+def _seam_pairs(a, b, connectivity):
+    """
+    Пары меток соседних пикселей на границе двух тайлов:
+    a — крайний ряд одного тайла, b — прилегающий ряд соседнего.
+    """
+    pairs = [(a, b)]
+    if connectivity == 8 and len(a) > 1:
+        pairs.append((a[:-1], b[1:]))
+        pairs.append((a[1:], b[:-1]))
+    return pairs
+
+
+def tiled_watershed_components(image, tile_size=1024, overlap=64, prefilter=None,
+                               connectivity=8, open_iterations=2,
+                               dilate_iterations=3, fg_ratio=0.7):
+    """
+    Связные компоненты маски watershed_mask, посчитанные по тайлам.
+
+    Изображение обходится тайлами tile_size x tile_size с перекрытием
+    overlap пикселей с каждой стороны, поэтому пиковая память ограничена
+    размером тайла, а не кадра. Глобальные величины (порог Оцу и максимум
+    distance transform) собираются предварительными проходами, компоненты
+    на границах тайлов склеиваются системой непересекающихся множеств.
+    prefilter — подавление шума, применяемое к каждому тайлу.
+
+    Результат совпадает с raster_order(cv2.connectedComponentsWithStats(...))
+    по маске всего изображения — те же компоненты в том же порядке
+    (по первому пикселю в порядке развертки), если перекрытие больше
+    радиуса самого крупного объекта плюс размер сглаживания и морфологии
+    (~10 пикселей); карта меток не строится, вместо нее возвращается None:
+    (numLabels, None, stats, centroids).
+    """
+    if prefilter is None:
+        prefilter = lambda tile: tile
+    height, width = image.shape[:2]
+    tiles = list(_tiles(height, width, tile_size, overlap))
+
+    def prepared(crop, core):
+        (y0, y1, x0, x1) = core
+        (cy0, cy1, cx0, cx1) = crop
+        tile = prefilter(image[cy0:cy1, cx0:cx1])
+        return tile, (slice(y0 - cy0, y1 - cy0), slice(x0 - cx0, x1 - cx0))
+
+    # 1) гистограмма сглаженной яркости -> порог Оцу
+    hist = np.zeros(256, dtype=np.int64)
+    for _, _, core, crop in tiles:
+        tile, inner = prepared(crop, core)
+        hist += np.bincount(_blurred_gray(tile)[inner].ravel(), minlength=256)
+    threshold = otsu_threshold(hist)
+
+    # 2) максимум distance transform по всему изображению
+    max_dist = 0.0
+    for _, _, core, crop in tiles:
+        tile, inner = prepared(crop, core)
+        opening = _opening(_blurred_gray(tile), threshold, open_iterations)
+        dist = cv2.distanceTransform(opening, cv2.DIST_L2, 5)
+        max_dist = max(max_dist, float(dist[inner].max()))
+
+    # 3) watershed и компоненты по тайлам
+    stats_parts = []
+    centroid_parts = []
+    first_parts = []
+    edges = {}
+    background = []
+    count = 0
+    for ty, tx, core, crop in tiles:
+        tile, inner = prepared(crop, core)
+        mask = watershed_mask(tile, open_iterations, dilate_iterations, fg_ratio,
+                              threshold=threshold, max_dist=max_dist)[inner]
+        n, labels, stats, centroids = cv2.connectedComponentsWithStats(
+            mask, connectivity=connectivity, ltype=cv2.CV_32S)
+        (y0, y1, x0, x1) = core
+        stats[:, cv2.CC_STAT_LEFT] += x0
+        stats[:, cv2.CC_STAT_TOP] += y0
+        centroids += (x0, y0)
+        background.append((stats[0], centroids[0]))
+
+        # первый пиксель каждого куска в порядке развертки
+        first = _first_pixels(labels, stats, width, y0, x0)
+
+        edges[ty, tx] = tuple(
+            np.where(side > 0, side.astype(np.int64) + count, 0)
+            for side in (labels[0], labels[-1], labels[:, 0], labels[:, -1]))
+        stats_parts.append(stats[1:])
+        centroid_parts.append(centroids[1:])
+        first_parts.append(first)
+        count += n - 1
+
+    # склейка кусков через границы тайлов
+    pairs = []
+    for (ty, tx), (top, bottom, left, right) in edges.items():
+        if (ty, tx + 1) in edges:
+            pairs += _seam_pairs(right, edges[ty, tx + 1][2], connectivity)
+        if (ty + 1, tx) in edges:
+            pairs += _seam_pairs(bottom, edges[ty + 1, tx][0], connectivity)
+        if connectivity == 8 and (ty + 1, tx + 1) in edges:
+            pairs.append((bottom[-1:], edges[ty + 1, tx + 1][0][:1]))
+        if connectivity == 8 and (ty + 1, tx - 1) in edges:
+            pairs.append((bottom[:1], edges[ty + 1, tx - 1][0][-1:]))
+    parent = list(range(count + 1))
+    if pairs:
+        a = np.concatenate([p[0] for p in pairs])
+        b = np.concatenate([p[1] for p in pairs])
+        linked = (a > 0) & (b > 0) & (a != b)
+        for i, j in np.unique(np.stack([a[linked], b[linked]], axis=1), axis=0):
+            ri, rj = _find(parent, int(i)), _find(parent, int(j))
+            if ri != rj:
+                parent[max(ri, rj)] = min(ri, rj)
+    roots = np.array([_find(parent, i) for i in range(count + 1)])[1:]
+
+    stats = np.concatenate(stats_parts) if count else np.zeros((0, 5), np.int32)
+    centroids = np.concatenate(centroid_parts) if count else np.zeros((0, 2))
+    first = np.concatenate(first_parts) if count else np.zeros(0, np.int64)
+    root_ids, group = np.unique(roots, return_inverse=True)
+    m = len(root_ids)
+
+    left = np.full(m, width, dtype=np.int64)
+    top = np.full(m, height, dtype=np.int64)
+    right = np.zeros(m, dtype=np.int64)
+    bottom = np.zeros(m, dtype=np.int64)
+    area = np.zeros(m, dtype=np.int64)
+    moment = np.zeros((m, 2))
+    order_key = np.full(m, np.iinfo(np.int64).max)
+    np.minimum.at(left, group, stats[:, cv2.CC_STAT_LEFT])
+    np.minimum.at(top, group, stats[:, cv2.CC_STAT_TOP])
+    np.maximum.at(right, group, stats[:, cv2.CC_STAT_LEFT] + stats[:, cv2.CC_STAT_WIDTH])
+    np.maximum.at(bottom, group, stats[:, cv2.CC_STAT_TOP] + stats[:, cv2.CC_STAT_HEIGHT])
+    np.add.at(area, group, stats[:, cv2.CC_STAT_AREA])
+    np.add.at(moment, group, centroids * stats[:, cv2.CC_STAT_AREA, None])
+    np.minimum.at(order_key, group, first)
+
+    order = np.argsort(order_key, kind="stable")
+    merged = np.empty((m + 1, 5), dtype=np.int32)
+    merged_centroids = np.empty((m + 1, 2))
+    merged[1:, cv2.CC_STAT_LEFT] = left[order]
+    merged[1:, cv2.CC_STAT_TOP] = top[order]
+    merged[1:, cv2.CC_STAT_WIDTH] = (right - left)[order]
+    merged[1:, cv2.CC_STAT_HEIGHT] = (bottom - top)[order]
+    merged[1:, cv2.CC_STAT_AREA] = area[order]
+    if m:
+        merged_centroids[1:] = (moment / area[:, None])[order]
+
+    # фон — объединение фоновых кусков всех тайлов
+    bg_stats = np.array([s for s, _ in background], dtype=np.int64)
+    bg_area = bg_stats[:, cv2.CC_STAT_AREA]
+    if bg_area.sum() > 0:
+        filled = bg_area > 0
+        bg_stats = bg_stats[filled]
+        bg_left = bg_stats[:, cv2.CC_STAT_LEFT].min()
+        bg_top = bg_stats[:, cv2.CC_STAT_TOP].min()
+        merged[0] = (
+            bg_left, bg_top,
+            (bg_stats[:, cv2.CC_STAT_LEFT] + bg_stats[:, cv2.CC_STAT_WIDTH]).max() - bg_left,
+            (bg_stats[:, cv2.CC_STAT_TOP] + bg_stats[:, cv2.CC_STAT_HEIGHT]).max() - bg_top,
+            bg_area.sum(),
+        )
+        bg_centroids = np.array([c for _, c in background])[filled]
+        merged_centroids[0] = (bg_centroids * bg_area[filled, None]).sum(axis=0) / bg_area.sum()
+    else:
+        merged[0] = 0
+        merged_centroids[0] = np.nan
+
+    return (m + 1, None, merged, merged_centroids)
@@ -1,8 +1,13 @@
-import sys
+import io
 import struct
-import csv
 import json
+import warnings
+from collections import namedtuple
 import cv2
+import numpy as np
+
+from structures.hist_store import (HIST_STORE_DATA_OFFSET, HIST_STORE_DTYPES, HIST_STORE_HEADER,
+                                   HIST_STORE_MAGIC, HIST_STORE_VERSION)
 
 """
 Стратегия (Strategy)
@@ -14,52 +19,366 @@ class HistDecoder:
     def decode(file_path):
         raise NotImplementedError()
 
+    @staticmethod
+    def decode_bytes(data):
+        """
+        Разбор уже прочитанного содержимого файла (bytes).
+        """
+        raise NotImplementedError()
+
 
 class BinHistDecoder(HistDecoder):
+    """
+    256 значений float32 подряд, little-endian.
+    """
+    DTYPE = np.dtype("<f4")
+    SIZE = DTYPE.itemsize * 256
+
     @staticmethod
     def decode(file_path):
-        data = []
-        with open(file_path, 'rb') as file:
-            data = struct.unpack('f' * 256, file.read(sys.getsizeof(0.0) * 256))
+        data = np.fromfile(file_path, dtype=BinHistDecoder.DTYPE, count=256)
+        if data.size != 256:
+            raise RuntimeError("Файл %s короче %d байт" % (file_path, BinHistDecoder.SIZE))
+        return data
 
-        data = {i: data[i] for i in range(len(data))}
+    @staticmethod
+    def decode_bytes(data):
+        if len(data) < BinHistDecoder.SIZE:
+            raise RuntimeError("Данные короче %d байт" % BinHistDecoder.SIZE)
+        return np.frombuffer(data, dtype=BinHistDecoder.DTYPE, count=256)
+
+# ошибка разбора строки текстовой гистограммы; line — номер строки с 1
+HistParseError = namedtuple("HistParseError", ["path", "line", "text", "reason"])
 
-        return data
 
-class CsvHistDecoder(HistDecoder):
+class TextHistBulkDecoder(HistDecoder):
+    """
+    Разбор многих текстовых гистограмм (строки "ключ значение" или
+    "ключ,значение") в одну матрицу N x 256.
+
+    Структура строк проверяется векторно по байтам всех файлов сразу,
+    числа разбираются одним вызовом np.fromstring. Только файлы с
+    ошибками разбираются построчно — чтобы сообщить номера плохих строк.
+    """
     @staticmethod
-    def decode(file_path):
-        data = None
-        with open(file_path) as csv_file:
-            reader = csv.reader(csv_file)
-            data = dict(reader)
-            data = {int(i): float(key) for i, key in data.items()}
-        return data
+    def _normalize(data):
+        return data.replace(b",", b" ").replace(b"\r", b" ")
+
+    # байты, из которых состоят обычные десятичные числа
+    _NUMBER_BYTES = np.zeros(256, dtype=bool)
+    _NUMBER_BYTES[np.frombuffer(b"0123456789+-.eE \t\n", dtype=np.uint8)] = True
 
-class TxtHistDecoder(HistDecoder):
     @staticmethod
-    def decode(file_path):
-        data = None
-        with open(file_path, "r") as file:
-            source = file.read().split()
-            data = {int(i): float(source[2 * i + 1]) for i in range(len(source) // 2)}
-        return data
+    def _scan_lines(buffer, lines):
+        """
+        Число полей в каждой строке и признак строки с посторонними
+        байтами (nan, inf, текст), которую сразу отдаем построчному разбору.
+        """
+        raw = np.frombuffer(buffer, dtype=np.uint8)
+        newline = raw == ord("\n")
+        blank = newline | (raw == ord(" ")) | (raw == ord("\t"))
+        starts = ~blank
+        starts[1:] &= blank[:-1]
+        # номер строки каждого байта — по позициям переводов строк
+        breaks = np.flatnonzero(newline)
+        tokens = np.bincount(np.searchsorted(breaks, np.flatnonzero(starts)), minlength=lines)
+        strange = np.searchsorted(breaks, np.flatnonzero(~TextHistBulkDecoder._NUMBER_BYTES[raw]))
+        return tokens, np.bincount(strange, minlength=lines) != 0
+
+    @staticmethod
+    def _parse_numbers(text, expected):
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            try:
+                numbers = np.fromstring(text, dtype=np.float64, sep=" ")
+            except (ValueError, DeprecationWarning):
+                return None
+        return numbers if numbers.size == expected else None
+
+    @staticmethod
+    def _parse_files(normalized, pairs_per_file, files, parsed, good):
+        """
+        Числа файлов files одним вызовом; если где-то есть нечисловое
+        поле, список делится пополам, пока плохие файлы не останутся
+        по одному — они помечаются в good как требующие построчного разбора.
+        """
+        if not len(files):
+            return
+        text = b" ".join(normalized[i] for i in files).decode("ascii", "replace")
+        numbers = TextHistBulkDecoder._parse_numbers(text, 2 * int(pairs_per_file[files].sum()))
+        if numbers is not None:
+            parsed.append(numbers)
+        elif len(files) == 1:
+            good[files[0]] = False
+        else:
+            middle = len(files) // 2
+            TextHistBulkDecoder._parse_files(normalized, pairs_per_file, files[:middle],
+                                             parsed, good)
+            TextHistBulkDecoder._parse_files(normalized, pairs_per_file, files[middle:],
+                                             parsed, good)
+
+    @staticmethod
+    def _parse_lines(path, data, row, errors):
+        """
+        Медленный построчный разбор одного файла с ошибками.
+        """
+        for number, line in enumerate(data.split(b"\n"), 1):
+            parts = TextHistBulkDecoder._normalize(line).split()
+            if not parts:
+                continue
+            text = line.decode("utf-8", "replace").rstrip("\r")
+            if len(parts) != 2:
+                errors.append(HistParseError(path, number, text,
+                                             "ожидается 2 поля, найдено %d" % len(parts)))
+                continue
+            try:
+                key = float(parts[0])
+                value = float(parts[1])
+            except ValueError:
+                errors.append(HistParseError(path, number, text, "не число"))
+                continue
+            if key != int(key) or not 0 <= key < 256:
+                errors.append(HistParseError(path, number, text,
+                                             "ключ должен быть целым от 0 до 255"))
+                continue
+            row[int(key)] = value
+
+    @staticmethod
+    def parse(contents, paths=None):
+        """
+        contents — список содержимого файлов (bytes).
+        Возвращает (matrix, errors): матрицу N x 256 и список HistParseError.
+        Корректные строки файла с ошибками все равно попадают в матрицу.
+        """
+        if paths is None:
+            paths = list(range(len(contents)))
+        matrix = np.zeros((len(contents), 256), dtype=np.float64)
+        errors = []
+        if not contents:
+            return matrix, errors
+
+        normalized = [TextHistBulkDecoder._normalize(data) for data in contents]
+        line_counts = np.array([data.count(b"\n") + 1 for data in normalized])
+        buffer = b"\n".join(normalized)
+        tokens, strange = TextHistBulkDecoder._scan_lines(buffer, int(line_counts.sum()))
+        file_of_line = np.repeat(np.arange(len(contents)), line_counts)
+        bad_files = np.unique(file_of_line[((tokens != 0) & (tokens != 2)) | strange])
+
+        good = np.ones(len(contents), dtype=bool)
+        good[bad_files] = False
+        good_lines = good[file_of_line] & (tokens == 2)
+        pairs_per_file = np.bincount(file_of_line[good_lines], minlength=len(contents))
+
+        parsed = []
+        TextHistBulkDecoder._parse_files(normalized, pairs_per_file,
+                                         np.nonzero(good)[0], parsed, good)
+        if parsed:
+            numbers = np.concatenate(parsed)
+            keys = numbers[0::2]
+            values = numbers[1::2]
+            rows = np.repeat(np.nonzero(good)[0], pairs_per_file[good])
+            valid_keys = (keys == np.floor(keys)) & (keys >= 0) & (keys < 256)
+            if not valid_keys.all():
+                good[np.unique(rows[~valid_keys])] = False
+                keep = good[rows]
+                keys, values, rows = keys[keep], values[keep], rows[keep]
+            matrix[rows, keys.astype(np.intp)] = values
+
+        for i in np.nonzero(~good)[0]:
+            TextHistBulkDecoder._parse_lines(paths[i], contents[i], matrix[i], errors)
+        return matrix, errors
+
+    @staticmethod
+    def decode_many(file_paths, batch=1024):
+        """
+        Файлы читаются и разбираются пачками по batch: в памяти только
+        содержимое одной пачки, матрица результата заполняется по строкам.
+        """
+        if batch < 1:
+            raise ValueError("batch должен быть положительным")
+        file_paths = list(file_paths)
+        matrix = np.zeros((len(file_paths), 256), dtype=np.float64)
+        errors = []
+        for start in range(0, len(file_paths), batch):
+            paths = file_paths[start:start + batch]
+            contents = []
+            for file_path in paths:
+                with open(file_path, "rb") as file:
+                    contents.append(file.read())
+            (matrix[start:start + len(paths)], batch_errors) = TextHistBulkDecoder.parse(
+                contents, paths)
+            errors.extend(batch_errors)
+        return matrix, errors
+
+    @staticmethod
+    def decode_bytes(data):
+        matrix, errors = TextHistBulkDecoder.parse([data])
+        if errors:
+            error = errors[0]
+            raise RuntimeError("Строка %d: %s (%r)" % (error.line, error.reason, error.text))
+        return matrix[0]
+
+    @classmethod
+    def decode(cls, file_path):
+        with open(file_path, 'rb') as file:
+            return cls.decode_bytes(file.read())
+
+class CsvHistDecoder(TextHistBulkDecoder):
+    pass
+
+class TxtHistDecoder(TextHistBulkDecoder):
+    pass
 
 class JsonHistDecoder(HistDecoder):
     @staticmethod
     def decode(file_path):
-        data = None
-        with open(file_path, 'r') as file:
-            data = json.load(file)
+        with open(file_path, 'rb') as file:
+            return JsonHistDecoder.decode_bytes(file.read())
+
+    @staticmethod
+    def decode_bytes(data):
+        data = json.loads(data)
         data = {data['keys'][i]: data['values'][i] for i in range(len(data['keys']))}
 
         return data
 
 class ImageHistDecoder(HistDecoder):
+    """
+    Нормированная гистограмма яркостей 8-битного изображения.
+    Каждый канал считается за один проход cv2.calcHist.
+    """
+    @staticmethod
+    def load(file_path, channels=False):
+        """
+        Файл .npy открывается через np.memmap (изображение HxW или HxWx3),
+        остальные форматы читаются cv2.imread.
+        """
+        if file_path.lower().endswith(".npy"):
+            image = np.load(file_path, mmap_mode="r")
+            if not channels and image.ndim == 3:
+                raise ValueError("Для многоканального %s нужен channels=True" % file_path)
+            return image
+        image = cv2.imread(file_path, cv2.IMREAD_COLOR if channels else cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            raise RuntimeError(f"Не удалось открыть файл {file_path}")
+        return image
+
+    @staticmethod
+    def histogram(image, mask=None, roi=None, chunk_rows=None):
+        """
+        Гистограммы всех каналов image: массив C x 256, нормированный
+        на число учтенных пикселей.
+        mask — маска HxW (учитываются ненулевые пиксели),
+        roi — прямоугольник (x, y, w, h),
+        chunk_rows — обработка полосами по chunk_rows строк, чтобы
+        memmap-изображение не читалось в память целиком.
+        """
+        if image.dtype != np.uint8:
+            raise ValueError("Ожидается 8-битное изображение")
+        if roi is not None:
+            (x, y, w, h) = roi
+            image = image[y:y + h, x:x + w]
+            if mask is not None:
+                mask = mask[y:y + h, x:x + w]
+        if mask is not None:
+            mask = np.asarray(mask)
+            if mask.shape != image.shape[:2]:
+                raise ValueError("Размер маски не совпадает с изображением")
+            if mask.dtype != np.uint8:
+                mask = mask.astype(np.uint8)
+        count = 1 if image.ndim == 2 else image.shape[2]
+        step = chunk_rows or max(image.shape[0], 1)
+
+        hist = np.zeros((count, 256), dtype=np.float64)
+        for y in range(0, image.shape[0], step):
+            block = np.ascontiguousarray(image[y:y + step])
+            block_mask = None if mask is None else np.ascontiguousarray(mask[y:y + step])
+            for c in range(count):
+                hist[c] += cv2.calcHist([block], [c], block_mask, [256], [0, 256]).reshape(-1)
+
+        total = hist[0].sum()
+        if total:
+            hist /= total
+        return hist
+
+    @staticmethod
+    def decode(file_path, mask=None, roi=None, channels=False, chunk_rows=None):
+        """
+        Массив из 256 значений; при channels=True — массив C x 256
+        по каналам (B, G, R для цветных файлов).
+        """
+        image = ImageHistDecoder.load(file_path, channels)
+        hist = ImageHistDecoder.histogram(image, mask, roi, chunk_rows)
+        return hist if channels else hist[0]
+
+    @staticmethod
+    def decode_bytes(data, mask=None, roi=None, channels=False, chunk_rows=None):
+        if data.startswith(b"\x93NUMPY"):
+            image = np.load(io.BytesIO(data))
+        else:
+            flags = cv2.IMREAD_COLOR if channels else cv2.IMREAD_GRAYSCALE
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+            if image is None:
+                raise RuntimeError("Не удалось декодировать изображение")
+        if not channels and image.ndim == 3:
+            raise ValueError("Для многоканального изображения нужен channels=True")
+        hist = ImageHistDecoder.histogram(image, mask, roi, chunk_rows)
+        return hist if channels else hist[0]
+
+
+class HistStoreDecoder(HistDecoder):
+    """
+    Контейнер .hst с множеством гистограмм (формат — в structures.hist_store).
+    Матрица значений читается через np.memmap без копирования.
+    """
+    @staticmethod
+    def read_header(file):
+        return HistStoreDecoder.parse_header(file.read(struct.calcsize(HIST_STORE_HEADER)))
+
+    @staticmethod
+    def parse_header(header):
+        header = header[:struct.calcsize(HIST_STORE_HEADER)]
+        if len(header) < struct.calcsize(HIST_STORE_HEADER):
+            raise RuntimeError("Файл не является хранилищем гистограмм")
+        (magic, version, dtype_code, count, bins, index_offset) = struct.unpack(
+            HIST_STORE_HEADER, header)
+        if magic != HIST_STORE_MAGIC:
+            raise RuntimeError("Файл не является хранилищем гистограмм")
+        if version != HIST_STORE_VERSION:
+            raise RuntimeError("Неподдерживаемая версия хранилища гистограмм: %d" % version)
+        return HIST_STORE_DTYPES[dtype_code], count, bins, index_offset
+
+    @staticmethod
+    def decode_many(file_path, mmap=True):
+        """
+        Возвращает (names, matrix): список имен и матрицу count x bins.
+        При mmap=True матрица — np.memmap только для чтения.
+        """
+        with open(file_path, "rb") as file:
+            dtype, count, bins, index_offset = HistStoreDecoder.read_header(file)
+            file.seek(index_offset)
+            names = json.loads(file.read().decode("utf-8"))
+            if count == 0:
+                return names, np.zeros((0, bins), dtype=dtype)
+            if not mmap:
+                file.seek(HIST_STORE_DATA_OFFSET)
+                matrix = np.fromfile(file, dtype=dtype, count=count * bins)
+                return names, matrix.reshape(count, bins)
+            # отображается уже открытый файл — второго открытия нет
+            matrix = np.memmap(file, dtype=dtype, mode="r",
+                               offset=HIST_STORE_DATA_OFFSET, shape=(count, bins))
+        return names, matrix
+
     @staticmethod
     def decode(file_path):
-        image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
+        names, matrix = HistStoreDecoder.decode_many(file_path)
+        if not names:
+            raise RuntimeError("Хранилище гистограмм %s пусто" % file_path)
+        return matrix[0]
 
-        num = image.shape[0] * image.shape[1]
-        data = {i: (image == i).sum() / num for i in range(0, 256)}
-        return data
\ No newline at end of file
+    @staticmethod
+    def decode_bytes(data):
+        dtype, count, bins, index_offset = HistStoreDecoder.parse_header(data)
+        if count == 0:
+            raise RuntimeError("Хранилище гистограмм пусто")
+        return np.frombuffer(data, dtype=dtype, count=bins, offset=HIST_STORE_DATA_OFFSET)
@@ -1,19 +1,45 @@
 import sys
 import struct
 import csv
+import io
 import json
 
+import numpy as np
+
+from structures.hist_store import (HIST_STORE_CODES, HIST_STORE_DATA_OFFSET, HIST_STORE_HEADER,
+                                   HIST_STORE_MAGIC, HIST_STORE_VERSION)
+
 """
 Стратегия (Strategy) для записи гистограмм.
 """
 
 
+def as_values(data):
+    """
+    Значения гистограммы в виде массива из 256 элементов:
+    data — словарь {int: float}, массив или объект с атрибутом values (Hist).
+    """
+    if isinstance(data, dict):
+        values = np.zeros(256, dtype=np.float64)
+        for key, value in data.items():
+            values[key] = value
+        return values
+    return np.asarray(getattr(data, "values", data))
+
+
 class HistEncoder:
     @staticmethod
     def encode(file_path, data):
         """
         file_path — имя выходного файла
-        data — словарь вида {int: float} длиной 256.
+        data — словарь вида {int: float} длиной 256 или массив из 256 значений.
+        """
+        raise NotImplementedError()
+
+    @classmethod
+    def encode_bytes(cls, data):
+        """
+        Содержимое файла (bytes) без записи на диск.
         """
         raise NotImplementedError()
 
@@ -21,10 +47,12 @@ class HistEncoder:
 class BinHistEncoder(HistEncoder):
     @staticmethod
     def encode(file_path, data):
-        values = [float(data.get(i, 0.0)) for i in range(256)]
         with open(file_path, "wb") as file:
-            packed = struct.pack("f" * len(values), *values)
-            file.write(packed)
+            file.write(BinHistEncoder.encode_bytes(data))
+
+    @classmethod
+    def encode_bytes(cls, data):
+        return as_values(data).astype("<f4").tobytes()
 
 
 class CsvHistEncoder(HistEncoder):
@@ -32,23 +60,76 @@ class CsvHistEncoder(HistEncoder):
     def encode(file_path, data):
         with open(file_path, "w", newline="") as csv_file:
             writer = csv.writer(csv_file)
-            for key in sorted(data.keys()):
-                writer.writerow([key, data[key]])
+            writer.writerows(enumerate(as_values(data).tolist()))
+
+    @classmethod
+    def encode_bytes(cls, data):
+        buffer = io.StringIO(newline="")
+        csv.writer(buffer).writerows(enumerate(as_values(data).tolist()))
+        return buffer.getvalue().encode("utf-8")
 
 
 class TxtHistEncoder(HistEncoder):
     @staticmethod
     def encode(file_path, data):
         with open(file_path, "w") as file:
-            for key in sorted(data.keys()):
-                file.write(f"{key} {data[key]}\n")
+            file.writelines(f"{key} {value}\n"
+                            for key, value in enumerate(as_values(data).tolist()))
+
+    @classmethod
+    def encode_bytes(cls, data):
+        return "".join(f"{key} {value}\n"
+                       for key, value in enumerate(as_values(data).tolist())).encode("utf-8")
 
 
 class JsonHistEncoder(HistEncoder):
     @staticmethod
     def encode(file_path, data):
-        keys = sorted(data.keys())
-        values = [data[k] for k in keys]
-        payload = {"keys": keys, "values": values}
-        with open(file_path, "w") as file:
-            json.dump(payload, file)
+        with open(file_path, "wb") as file:
+            file.write(JsonHistEncoder.encode_bytes(data))
+
+    @classmethod
+    def encode_bytes(cls, data):
+        values = as_values(data).tolist()
+        payload = {"keys": list(range(len(values))), "values": values}
+        return json.dumps(payload).encode("utf-8")
+
+
+class HistStoreEncoder(HistEncoder):
+    """
+    Запись множества гистограмм в один контейнер .hst
+    (формат — в structures.hist_store).
+    """
+    @staticmethod
+    def encode_many(file_path, names, matrix, dtype="float32"):
+        """
+        names — список имен, matrix — массив count x bins
+        (строка i — гистограмма names[i]).
+        """
+        parts = HistStoreEncoder._parts(names, matrix, dtype)
+        with open(file_path, "wb") as file:
+            for part in parts:
+                file.write(part)
+
+    @staticmethod
+    def _parts(names, matrix, dtype):
+        dtype = np.dtype(dtype).newbyteorder("<")
+        if dtype not in HIST_STORE_CODES:
+            raise ValueError("Неподдерживаемый тип данных хранилища: %s" % dtype)
+        matrix = np.ascontiguousarray(matrix, dtype=dtype)
+        if matrix.ndim != 2 or matrix.shape[0] != len(names):
+            raise ValueError("Ожидается матрица len(names) x bins")
+        count, bins = matrix.shape
+        index_offset = HIST_STORE_DATA_OFFSET + matrix.nbytes
+        header = struct.pack(HIST_STORE_HEADER, HIST_STORE_MAGIC, HIST_STORE_VERSION,
+                             HIST_STORE_CODES[dtype], count, bins, index_offset)
+        return (header.ljust(HIST_STORE_DATA_OFFSET, b"\0"), matrix.data,
+                json.dumps(list(names)).encode("utf-8"))
+
+    @staticmethod
+    def encode(file_path, data):
+        HistStoreEncoder.encode_many(file_path, ["0"], [as_values(data)])
+
+    @classmethod
+    def encode_bytes(cls, data):
+        return b"".join(HistStoreEncoder._parts(["0"], [as_values(data)], "float32"))
@@ -7,3 +7,4 @@ Hist.write("./data/out.bin", data)
 Hist.write("./data/out.txt", data)
 Hist.write("./data/out.json", data)
 Hist.write("./data/out.csv", data)
+Hist.write("./data/out.hst", data)
@@ -0,0 +1,189 @@
+import os
+import re
+
+import decoders.decoder
+import encoders.encoder
+from structures.hist_store import HIST_STORE_MAGIC
+
+"""
+Реестр (Registry) стратегий чтения и записи гистограмм.
+
+Формат файла определяется по сигнатуре (magic) в начале файла, затем
+по расширению, и только для файлов с неизвестным расширением (или без
+него) — по проверке заголовка (sniff): эти проверки лишь догадки, и
+расширение они не перекрывают.
+
+Флаги streaming и mmap говорят массовым загрузчикам (Hist.aread_many,
+Hist.read_many), как прочитать файл за одно открытие: mmap-форматы
+декодер отображает в память сам, остальные читаются целиком один раз,
+и формат определяется по тем же байтам.
+"""
+
+# сколько байт от начала файла достаточно для определения формата
+HEAD_SIZE = 64
+
+
+class HistCodec:
+    """
+    Описание формата гистограмм.
+
+    name — имя формата,
+    extensions — расширения файлов без точки,
+    decoder / encoder — стратегии из decoders.decoder / encoders.encoder
+        (None, если формат только читается или только пишется),
+    magic — байтовые сигнатуры начала файла,
+    sniff — функция (head, size) -> bool для форматов без сигнатуры,
+    streaming — декодер разбирает уже прочитанное содержимое файла за один
+        проход (decode_bytes), повторно файл не открывается,
+    mmap — декодер отдает данные через np.memmap без чтения файла целиком
+        (decode по пути); формат такого файла берется по расширению,
+        содержимое проверяет сам декодер.
+    """
+    def __init__(self, name, extensions, decoder=None, encoder=None, magic=(),
+                 sniff=None, streaming=False, mmap=False):
+        self.name = name
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.decoder = decoder
+        self.encoder = encoder
+        self.magic = tuple(magic)
+        self.sniff = sniff
+        self.streaming = streaming
+        self.mmap = mmap
+
+    def has_magic(self, head):
+        return any(head.startswith(magic) for magic in self.magic)
+
+    def guess(self, head, size):
+        return self.sniff is not None and self.sniff(head, size)
+
+    def __repr__(self):
+        return "HistCodec(%s)" % self.name
+
+
+_codecs = []
+
+
+def register_codec(codec, first=False):
+    """
+    Регистрация формата. При first=True он проверяется раньше уже
+    зарегистрированных, в том числе встроенных.
+    """
+    if any(c.name == codec.name for c in _codecs):
+        raise ValueError("Формат %s уже зарегистрирован" % codec.name)
+    if first:
+        _codecs.insert(0, codec)
+    else:
+        _codecs.append(codec)
+
+
+def unregister_codec(name):
+    _codecs[:] = [c for c in _codecs if c.name != name]
+
+
+def get_codecs():
+    return list(_codecs)
+
+
+def get_codec(name):
+    for codec in _codecs:
+        if codec.name == name:
+            return codec
+    raise ValueError("Формат %s не зарегистрирован" % name)
+
+
+def _extension(file_path):
+    return file_path.rsplit(".", 1)[-1].lower() if "." in file_path else ""
+
+
+def codec_by_extension(file_path, need="decoder"):
+    ext = _extension(file_path)
+    for codec in _codecs:
+        if ext in codec.extensions and getattr(codec, need) is not None:
+            return codec
+    return None
+
+
+def detect_codec(file_path, sniff=True):
+    """
+    Формат файла для чтения: по сигнатуре, по расширению, затем по
+    проверке заголовка.
+    При sniff=False файл не открывается и формат берется по расширению.
+    """
+    if sniff:
+        with open(file_path, "rb") as file:
+            head = file.read(HEAD_SIZE)
+            size = os.fstat(file.fileno()).st_size
+        return detect_codec_bytes(file_path, head, size)
+    codec = codec_by_extension(file_path)
+    if codec is None:
+        raise RuntimeError("Невозможно получить данные %s" % file_path)
+    return codec
+
+
+def detect_codec_bytes(file_path, head, size=None):
+    """
+    То же по уже прочитанному началу файла head (size — полный размер).
+    """
+    if size is None:
+        size = len(head)
+    head = head[:HEAD_SIZE]
+    readable = [codec for codec in _codecs if codec.decoder is not None]
+    for codec in readable:
+        if codec.has_magic(head):
+            return codec
+    codec = codec_by_extension(file_path)
+    if codec is not None:
+        return codec
+    for codec in readable:
+        if codec.guess(head, size):
+            return codec
+    raise RuntimeError("Невозможно получить данные %s" % file_path)
+
+
+_CSV_HEAD = re.compile(rb"\s*-?\d+\s*,")
+_TXT_HEAD = re.compile(rb"\s*-?\d+[ \t]+[-+.\deE]")
+
+
+def _sniff_bmp(head, size):
+    return head[:2] == b"BM" and int.from_bytes(head[2:6], "little") == size
+
+
+def _sniff_json(head, size):
+    return head.lstrip().startswith(b"{")
+
+
+def _sniff_csv(head, size):
+    return _CSV_HEAD.match(head) is not None
+
+
+def _sniff_txt(head, size):
+    return _TXT_HEAD.match(head) is not None
+
+
+def _sniff_bin(head, size):
+    return size == decoders.decoder.BinHistDecoder.SIZE
+
+
+register_codec(HistCodec("hst", ("hst",), decoders.decoder.HistStoreDecoder,
+                         encoders.encoder.HistStoreEncoder,
+                         magic=(HIST_STORE_MAGIC,), mmap=True))
+register_codec(HistCodec("npy", ("npy",), decoders.decoder.ImageHistDecoder,
+                         magic=(b"\x93NUMPY",), streaming=True, mmap=True))
+register_codec(HistCodec("png", ("png",), decoders.decoder.ImageHistDecoder,
+                         magic=(b"\x89PNG\r\n\x1a\n",), streaming=True))
+register_codec(HistCodec("jpeg", ("jpg", "jpeg"), decoders.decoder.ImageHistDecoder,
+                         magic=(b"\xff\xd8\xff",), streaming=True))
+register_codec(HistCodec("bmp", ("bmp",), decoders.decoder.ImageHistDecoder,
+                         sniff=_sniff_bmp, streaming=True))
+register_codec(HistCodec("json", ("json",), decoders.decoder.JsonHistDecoder,
+                         encoders.encoder.JsonHistEncoder, sniff=_sniff_json,
+                         streaming=True))
+register_codec(HistCodec("csv", ("csv",), decoders.decoder.CsvHistDecoder,
+                         encoders.encoder.CsvHistEncoder, sniff=_sniff_csv,
+                         streaming=True))
+register_codec(HistCodec("txt", ("txt",), decoders.decoder.TxtHistDecoder,
+                         encoders.encoder.TxtHistEncoder, sniff=_sniff_txt,
+                         streaming=True))
+register_codec(HistCodec("bin", ("bin",), decoders.decoder.BinHistDecoder,
+                         encoders.encoder.BinHistEncoder, sniff=_sniff_bin,
+                         streaming=True))
@@ -0,0 +1,258 @@
+"""
+Индекс для поиска похожих гистограмм в контейнере .hst.
+
+Гистограммы разбиты на грубые корзины (IVF): центры корзин находятся
+k-средними в пространстве Хеллингера (корень из нормированной
+гистограммы, где евклидово расстояние монотонно связано с расстоянием
+Бхаттачарьи). Запрос сравнивается только с гистограммами nprobe
+ближайших корзин; nprobe = nlist дает точный поиск.
+
+Индекс хранится в двух файлах:
+    <path>           контейнер .hst, строки сгруппированы по корзинам
+    <path>.ivf.npz   центры корзин и границы их строк
+Матрица при загрузке открывается через np.memmap.
+"""
+import numpy as np
+
+import decoders.decoder
+import encoders.encoder
+
+# сколько строк матрицы сравнивается с запросами за один раз
+CHUNK_ROWS = 65536
+
+
+def _as_matrix(queries):
+    matrix = np.asarray(queries, dtype=np.float64)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis]
+    if matrix.ndim != 2:
+        raise ValueError("Ожидается гистограмма или матрица гистограмм")
+    return matrix
+
+
+def _hellinger(matrix):
+    """
+    Корень из нормированных строк (нулевые строки остаются нулевыми);
+    для выбора корзины хватает float32.
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    sums = matrix.sum(axis=1, keepdims=True)
+    return np.sqrt(matrix / np.where(sums == 0, 1.0, sums))
+
+
+def _nearest(points, centroids):
+    """
+    Номера ближайших центров (евклидово расстояние) для строк points.
+    """
+    half_norms = 0.5 * (centroids * centroids).sum(axis=1)
+    return np.argmax(points @ centroids.T - half_norms, axis=1)
+
+
+# Ядра сравнения: (queries, rows) -> матрица стоимостей len(queries) x len(rows),
+# меньше — ближе. Формулы те же, что у Hist.compare (запрос — первый аргумент);
+# для мер сходства (correl, intersect) стоимость — сходство с обратным знаком.
+
+def _chisqr(queries, rows):
+    # sum (a - b)^2 / a по a != 0 = sum a - 2 sum b + sum b^2 / a
+    nonzero = queries != 0
+    inverse = np.divide(1.0, queries, out=np.zeros_like(queries), where=nonzero)
+    cost = (queries.sum(axis=1)[:, np.newaxis]
+            - 2.0 * (nonzero.astype(np.float64) @ rows.T)
+            + inverse @ (rows * rows).T)
+    return np.maximum(cost, 0.0, out=cost)
+
+
+def _bhattacharyya(queries, rows):
+    overlap = np.sqrt(queries) @ np.sqrt(rows).T
+    denom = np.sqrt(queries.sum(axis=1)[:, np.newaxis] * rows.sum(axis=1))
+    ratio = np.divide(overlap, denom, out=np.ones_like(overlap), where=denom != 0)
+    return np.sqrt(np.maximum(1.0 - ratio, 0.0))
+
+
+def _correl(queries, rows):
+    centered = queries - queries.mean(axis=1, keepdims=True)
+    bins = rows.shape[1]
+    row_var = (rows * rows).sum(axis=1) - bins * rows.mean(axis=1) ** 2
+    denom = np.sqrt((centered * centered).sum(axis=1)[:, np.newaxis] * row_var)
+    score = np.divide(centered @ rows.T, denom, out=np.ones((len(queries), len(rows))),
+                      where=denom != 0)
+    return -score
+
+
+def _intersect(queries, rows):
+    cost = np.empty((len(queries), len(rows)))
+    for i, query in enumerate(queries):
+        cost[i] = -np.minimum(rows, query).sum(axis=1)
+    return cost
+
+
+def _cdf(matrix):
+    cdf = np.cumsum(matrix, axis=1)
+    total = cdf[:, -1:]
+    return np.divide(cdf, total, out=np.zeros_like(cdf), where=total != 0)
+
+
+def _emd(queries, rows):
+    # для одномерных гистограмм EMD — площадь между функциями распределения
+    rows_cdf = _cdf(rows)
+    cost = np.empty((len(queries), len(rows)))
+    for i, query_cdf in enumerate(_cdf(queries)):
+        cost[i] = np.abs(rows_cdf - query_cdf).sum(axis=1)
+    return cost
+
+
+KERNELS = {
+    "chisqr": _chisqr,
+    "bhattacharyya": _bhattacharyya,
+    "correl": _correl,
+    "intersect": _intersect,
+    "emd": _emd,
+}
+
+# меры сходства: в результатах выдаются с исходным знаком
+SIMILARITIES = {"correl", "intersect"}
+
+
+class HistIndex:
+    """
+    names — имена гистограмм в порядке строк matrix,
+    offsets — границы строк корзин: корзина i занимает строки
+    offsets[i]:offsets[i + 1], ее центр — centroids[i].
+    """
+    SUFFIX = ".ivf.npz"
+
+    def __init__(self, names, matrix, centroids, offsets):
+        if len(names) != len(matrix) or offsets[-1] != len(matrix):
+            raise ValueError("Размеры индекса не согласованы")
+        self.names = list(names)
+        self.matrix = matrix
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def build(cls, names, matrix, nlist=None, iterations=10, sample=None, seed=0):
+        """
+        Построение индекса по матрице гистограмм (строка i — names[i]).
+        nlist — число корзин (по умолчанию около sqrt(N)),
+        sample — сколько строк брать для обучения центров
+        (по умолчанию 64 на корзину).
+        """
+        matrix = np.asarray(matrix)
+        count = len(matrix)
+        if len(names) != count:
+            raise ValueError("Ожидается матрица len(names) x bins")
+        if nlist is None:
+            nlist = int(np.clip(np.sqrt(count), 1, 4096))
+        nlist = max(1, min(nlist, count))
+        rng = np.random.default_rng(seed)
+
+        sample = min(count, sample or 64 * nlist)
+        points = _hellinger(matrix[np.sort(rng.choice(count, sample, replace=False))])
+        centroids = points[rng.choice(sample, nlist, replace=False)]
+        for _ in range(iterations):
+            labels = _nearest(points, centroids)
+            order = np.argsort(labels, kind="stable")
+            filled, starts, sizes = np.unique(labels[order], return_index=True,
+                                              return_counts=True)
+            sums = np.add.reduceat(points[order], starts, axis=0, dtype=np.float64)
+            centroids[filled] = sums / sizes[:, np.newaxis]
+
+        labels = np.empty(count, dtype=np.intp)
+        for start in range(0, count, CHUNK_ROWS):
+            labels[start:start + CHUNK_ROWS] = _nearest(
+                _hellinger(matrix[start:start + CHUNK_ROWS]), centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=nlist))))
+        return cls([names[i] for i in order], matrix[order], centroids, offsets)
+
+    @classmethod
+    def from_store(cls, store_path, **options):
+        """
+        Индекс по всем гистограммам контейнера .hst; options — как у build.
+        """
+        names, matrix = decoders.decoder.HistStoreDecoder.decode_many(store_path)
+        return cls.build(names, matrix, **options)
+
+    def save(self, path, dtype="float32"):
+        encoders.encoder.HistStoreEncoder.encode_many(path, self.names, self.matrix, dtype)
+        with open(path + self.SUFFIX, "wb") as file:
+            np.savez(file, centroids=self.centroids, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        names, matrix = decoders.decoder.HistStoreDecoder.decode_many(path, mmap)
+        with np.load(path + cls.SUFFIX) as ivf:
+            return cls(names, matrix, ivf["centroids"], ivf["offsets"])
+
+    def _probe(self, queries, nprobe):
+        """
+        Для каждой корзины — номера запросов, которые ее просматривают.
+        """
+        if nprobe >= self.nlist:
+            everyone = np.arange(len(queries))
+            return [everyone] * self.nlist
+        closeness = _hellinger(queries) @ self.centroids.T \
+            - 0.5 * (self.centroids * self.centroids).sum(axis=1)
+        nearest = np.argpartition(-closeness, nprobe - 1, axis=1)[:, :nprobe]
+        lists = [[] for _ in range(self.nlist)]
+        for query, buckets in enumerate(nearest):
+            for bucket in buckets:
+                lists[bucket].append(query)
+        return [np.array(queries_of, dtype=np.intp) for queries_of in lists]
+
+    def search(self, queries, k=10, method="chisqr", nprobe=8):
+        """
+        K ближайших гистограмм для каждого запроса.
+        queries — Hist, массив из 256 значений или матрица Q x 256.
+        Возвращает список (по запросам) списков пар (имя, значение меры),
+        от самого похожего; значение совпадает с Hist.compare(запрос, найденная).
+        """
+        if method not in KERNELS:
+            raise ValueError("Неизвестный метод сравнения гистограмм: %s" % method)
+        if k < 1 or nprobe < 1:
+            raise ValueError("k и nprobe должны быть положительными")
+        kernel = KERNELS[method]
+        queries = _as_matrix(queries)
+        best_cost = np.full((len(queries), k), np.inf)
+        best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+
+        for bucket, members in enumerate(self._probe(queries, nprobe)):
+            if not len(members):
+                continue
+            subset = queries[members]
+            for start in range(self.offsets[bucket], self.offsets[bucket + 1], CHUNK_ROWS):
+                stop = min(start + CHUNK_ROWS, self.offsets[bucket + 1])
+                cost = kernel(subset, np.asarray(self.matrix[start:stop], dtype=np.float64))
+                cost = np.concatenate((best_cost[members], cost), axis=1)
+                rows = np.concatenate((best_rows[members], np.broadcast_to(
+                    np.arange(start, stop), (len(members), stop - start))), axis=1)
+                keep = np.argpartition(cost, k - 1, axis=1)[:, :k]
+                best_cost[members] = np.take_along_axis(cost, keep, axis=1)
+                best_rows[members] = np.take_along_axis(rows, keep, axis=1)
+
+        order = np.argsort(best_cost, axis=1, kind="stable")
+        best_cost = np.take_along_axis(best_cost, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        sign = -1.0 if method in SIMILARITIES else 1.0
+        return [[(self.names[row], sign * float(cost))
+                 for row, cost in zip(rows, costs) if row >= 0]
+                for rows, costs in zip(best_rows, best_cost)]
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    matrix = rng.gamma(1.0, size=(100000, 256)).astype(np.float32)
+    index = HistIndex.build([str(i) for i in range(len(matrix))], matrix)
+    started = time.perf_counter()
+    found = index.search(matrix[:100], k=5, method="bhattacharyya")
+    print("%d запросов: %.3f с" % (len(found), time.perf_counter() - started))
+    print(found[0])
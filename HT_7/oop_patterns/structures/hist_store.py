@@ -0,0 +1,29 @@
+"""
+Формат контейнера .hst — много гистограмм в одном файле.
+
+    [заголовок, HIST_STORE_DATA_OFFSET байт]
+        magic       4s   b"HSTR"
+        version     H
+        dtype       B    код из HIST_STORE_DTYPES
+        (резерв)    x
+        count       I    число гистограмм
+        bins        I    число корзин в каждой
+        index       Q    смещение индекса имен
+    [данные]  матрица count x bins, little-endian, по строкам
+    [индекс]  JSON-список имен в UTF-8
+
+Матрица лежит по фиксированному выровненному смещению,
+поэтому читается через np.memmap без разбора файла.
+"""
+import numpy as np
+
+
+HIST_STORE_MAGIC = b"HSTR"
+HIST_STORE_VERSION = 1
+HIST_STORE_HEADER = "<4sHBxIIQ"
+HIST_STORE_DATA_OFFSET = 64
+HIST_STORE_DTYPES = {
+    0: np.dtype("<f4"),
+    1: np.dtype("<u4"),
+}
+HIST_STORE_CODES = {dtype: code for code, dtype in HIST_STORE_DTYPES.items()}
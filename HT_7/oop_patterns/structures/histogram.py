@@ -1,35 +1,108 @@
-import copy
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 
 import decoders.decoder
 import encoders.encoder
+import structures.codecs
 
 """
 Стратегия (Strategy)
 """
 
 
+def _read_file(file_path):
+    with open(file_path, "rb") as file:
+        return file.read()
+
+
+def _write_file(file_path, data):
+    with open(file_path, "wb") as file:
+        file.write(data)
+
+
+def _decode(file_path, data, **options):
+    # формат — по уже прочитанным байтам; только декодер без streaming
+    # открывает файл сам
+    codec = structures.codecs.detect_codec_bytes(file_path, data)
+    if codec.streaming:
+        return codec.decoder.decode_bytes(data, **options)
+    return codec.decoder.decode(file_path, **options)
+
+
+def _mapped_codec(file_path):
+    codec = structures.codecs.codec_by_extension(file_path)
+    return codec if codec is not None and codec.mmap else None
+
+
+def _load(file_path, **options):
+    """
+    Чтение за одно открытие файла: mmap-формат декодер отображает
+    в память сам, остальные файлы читаются целиком и распознаются
+    по тем же байтам.
+    """
+    codec = _mapped_codec(file_path)
+    if codec is not None:
+        return codec.decoder.decode(file_path, **options)
+    return _decode(file_path, _read_file(file_path), **options)
+
+
+def _encode(file_path, values):
+    codec = structures.codecs.codec_by_extension(file_path, need="encoder")
+    if codec is None:
+        raise RuntimeError("Невозможно сохранить данные в формате %s" % file_path)
+    return codec.encoder.encode_bytes(values)
+
+
+async def _bounded(items, limit, handler):
+    """
+    handler(item) для всех items, не больше limit одновременно.
+    Элементы берутся из итератора по мере освобождения обработчиков,
+    поэтому items может быть ленивым. Результаты — в порядке items.
+    При первой ошибке остальные обработчики отменяются, и она
+    поднимается только после их завершения.
+    """
+    if limit < 1:
+        raise ValueError("limit должен быть положительным")
+    iterator = enumerate(items)
+    results = {}
+
+    async def worker():
+        for index, item in iterator:
+            results[index] = await handler(item)
+
+    tasks = [asyncio.ensure_future(worker()) for _ in range(limit)]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+    return [results[i] for i in range(len(results))]
+
+
 class Hist:
     @classmethod
-    def read(cls, file_path):
+    def read(cls, file_path, sniff=True, **options):
         """
         Чтение гистограммы.
-        В зависимости от расширения файла выбирается нужная стратегия-декодер.
-        """
-        ext = file_path.rsplit(".", 1)[-1]
-        if ext == "bin":
-            decoder = decoders.decoder.BinHistDecoder
-        elif ext == "txt":
-            decoder = decoders.decoder.TxtHistDecoder
-        elif ext == "json":
-            decoder = decoders.decoder.JsonHistDecoder
-        elif ext == "csv":
-            decoder = decoders.decoder.CsvHistDecoder
-        elif ext.lower() in ("png", "jpg", "jpeg", "bmp"):
-            decoder = decoders.decoder.ImageHistDecoder
+        Стратегия-декодер выбирается реестром structures.codecs: по
+        содержимому файла, а если оно не распознано — по расширению
+        (при sniff=False — сразу по расширению). Файл открывается один
+        раз (см. флаги streaming и mmap в structures.codecs).
+        options передаются декодеру; для изображений это mask, roi,
+        chunk_rows и channels (при channels=True возвращается список Hist
+        по каналам).
+        """
+        if sniff:
+            data = _load(file_path, **options)
         else:
-            raise RuntimeError("Невозможно получить данные %s" % file_path)
-
-        data = decoder.decode(file_path)
+            data = structures.codecs.detect_codec(file_path, sniff).decoder.decode(
+                file_path, **options)
+        if options.get("channels"):
+            return [cls(row) for row in data]
         return cls(data)
 
     @classmethod
@@ -37,27 +110,231 @@ class Hist:
         """
         Запись гистограммы в файл.
         Формат определяется по расширению выходного файла.
-        data — словарь вида {int: float}.
-        """
-        ext = filename.rsplit(".", 1)[-1]
-        if ext == "bin":
-            encoder = encoders.encoder.BinHistEncoder
-        elif ext == "txt":
-            encoder = encoders.encoder.TxtHistEncoder
-        elif ext == "json":
-            encoder = encoders.encoder.JsonHistEncoder
-        elif ext == "csv":
-            encoder = encoders.encoder.CsvHistEncoder
-        else:
+        data — Hist, массив из 256 значений или словарь вида {int: float}.
+        """
+        codec = structures.codecs.codec_by_extension(filename, need="encoder")
+        if codec is None:
             raise RuntimeError("Невозможно сохранить данные в формате %s" % filename)
 
-        encoder.encode(filename, data)
+        codec.encoder.encode(filename, data)
+
+    @classmethod
+    def read_many(cls, file_path, names=None):
+        """
+        Чтение гистограмм из контейнера .hst.
+        Возвращает словарь {имя: Hist}; names ограничивает набор имен.
+        Матрица отображается в память, если у формата hst в реестре
+        structures.codecs стоит mmap.
+        """
+        mmap = structures.codecs.get_codec("hst").mmap
+        all_names, matrix = decoders.decoder.HistStoreDecoder.decode_many(file_path, mmap)
+        if names is None:
+            rows = range(len(all_names))
+        else:
+            index = {name: i for i, name in enumerate(all_names)}
+            rows = [index[name] for name in names]
+        return {all_names[i]: cls(matrix[i]) for i in rows}
+
+    @classmethod
+    def read_text_many(cls, file_paths, batch=1024):
+        """
+        Разбор многих текстовых гистограмм (.csv/.txt) в одну матрицу.
+        Возвращает (matrix, errors): matrix — массив len(file_paths) x 256,
+        errors — список decoders.decoder.HistParseError (путь, номер строки,
+        текст, причина); ошибки не прерывают разбор.
+        Файлы читаются и разбираются пачками по batch, так что в памяти
+        одновременно только одна пачка.
+        """
+        return decoders.decoder.TextHistBulkDecoder.decode_many(list(file_paths), batch)
+
+    @classmethod
+    def write_many(cls, filename, hists, dtype="float32"):
+        """
+        Запись гистограмм в один контейнер .hst.
+        hists — словарь {имя: Hist, массив или словарь {int: float}}.
+        """
+        names = [str(name) for name in hists]
+        matrix = np.empty((len(names), Hist.BINS), dtype=np.float64)
+        for row, hist in enumerate(hists.values()):
+            matrix[row] = hist.values if isinstance(hist, Hist) else Hist(hist).values
+        encoders.encoder.HistStoreEncoder.encode_many(filename, names, matrix, dtype)
+
+    @classmethod
+    async def aread_many(cls, paths, limit=64, executor=None, read_file=None):
+        """
+        Асинхронное чтение многих гистограмм: не больше limit файлов
+        одновременно. Файлы читаются в пуле потоков ввода-вывода, разбор
+        идет в executor (по умолчанию — пул потоков цикла событий;
+        подойдет и ProcessPoolExecutor). Файлы mmap-форматов (.hst, .npy)
+        не читаются целиком: их декодер отображает в executor.
+        read_file(path) -> bytes заменяет чтение файла, например, для
+        имитации задержки хранилища; тогда так читаются все файлы.
+        Возвращает список Hist в порядке paths.
+        """
+        loop = asyncio.get_running_loop()
+        mapped = read_file is None
+        read_file = read_file or _read_file
+        io_pool = ThreadPoolExecutor(limit)
+
+        async def handle(path):
+            if mapped and _mapped_codec(path) is not None:
+                return cls(await loop.run_in_executor(executor, _load, path))
+            data = await loop.run_in_executor(io_pool, read_file, path)
+            return cls(await loop.run_in_executor(executor, _decode, path, data))
+
+        try:
+            return await _bounded(paths, limit, handle)
+        finally:
+            # отмена задачи не останавливает уже начатый в потоке ввод-вывод:
+            # дожидаемся его, не блокируя цикл событий
+            await asyncio.to_thread(io_pool.shutdown, wait=True)
+
+    @classmethod
+    async def awrite_many(cls, items, limit=64, executor=None, write_file=None):
+        """
+        Асинхронная запись: items — словарь {путь: данные} или пары
+        (путь, данные); формат — по расширению пути. Кодирование идет
+        в executor, запись — в пуле потоков, не больше limit файлов
+        одновременно. write_file(path, data) заменяет запись файла.
+        """
+        loop = asyncio.get_running_loop()
+        write_file = write_file or _write_file
+        io_pool = ThreadPoolExecutor(limit)
+        if isinstance(items, dict):
+            items = items.items()
+
+        async def handle(item):
+            (path, data) = item
+            values = Hist(data).values
+            content = await loop.run_in_executor(executor, _encode, path, values)
+            await loop.run_in_executor(io_pool, write_file, path, content)
+
+        try:
+            await _bounded(items, limit, handle)
+        finally:
+            # отмена задачи не останавливает уже начатый в потоке ввод-вывод:
+            # дожидаемся его, не блокируя цикл событий
+            await asyncio.to_thread(io_pool.shutdown, wait=True)
+
+    BINS = 256
 
     def __init__(self, data):
-        self._data = data
+        """
+        data — массив из 256 значений (хранится без копирования),
+        словарь {int: float} или другой Hist.
+        """
+        if isinstance(data, Hist):
+            values = data._values
+        elif isinstance(data, dict):
+            values = np.zeros(self.BINS, dtype=np.float64)
+            if data:
+                keys = np.fromiter(data.keys(), dtype=np.intp, count=len(data))
+                values[keys] = np.fromiter(data.values(), dtype=np.float64, count=len(data))
+        else:
+            values = np.asarray(data)
+            if values.dtype.kind not in "fiu":
+                values = values.astype(np.float64)
+        if values.shape != (self.BINS,):
+            raise ValueError("Гистограмма должна содержать %d значений" % self.BINS)
+        values = values.view()
+        values.flags.writeable = False
+        self._values = values
+
+    @property
+    def values(self):
+        """
+        Значения гистограммы — массив только для чтения, без копирования.
+        """
+        return self._values
+
+    def get_array(self, copy=False):
+        return np.array(self._values, dtype=np.float64) if copy else self._values
 
     def get_data(self):
-        return copy.deepcopy(self._data)
+        """
+        Значения в виде словаря {int: float} (совместимость со старым API).
+        """
+        return dict(enumerate(self._values.tolist()))
+
+    def __array__(self, dtype=None, copy=None):
+        # протокол NumPy 2: без копии отдается сам внутренний массив
+        # (только для чтения), copy=True — всегда независимая копия
+        convert = dtype is not None and np.dtype(dtype) != self._values.dtype
+        if copy is False and convert:
+            raise ValueError("Нельзя привести гистограмму к %s без копии" % np.dtype(dtype))
+        if copy or convert:
+            return np.array(self._values, dtype=dtype, copy=True)
+        return self._values
+
+    def __len__(self):
+        return self.BINS
+
+    def __getitem__(self, key):
+        return self._values[key]
+
+    def __add__(self, other):
+        return Hist(self._values + np.asarray(other))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Hist(self._values - np.asarray(other))
+
+    def __mul__(self, other):
+        return Hist(self._values * np.asarray(other))
+
+    __rmul__ = __mul__
+
+    def sum(self):
+        return float(self._values.sum())
+
+    def normalize(self):
+        """
+        Гистограмма с суммой значений 1.
+        """
+        total = self._values.sum()
+        if total == 0:
+            return Hist(np.zeros(self.BINS))
+        return Hist(self._values / total)
+
+    def cumsum(self):
+        return Hist(np.cumsum(self._values, dtype=np.float64))
+
+    def compare(self, other, method="correl"):
+        """
+        Сравнение гистограмм по тем же формулам, что у cv2.compareHist:
+        correl, chisqr, intersect, bhattacharyya; emd — расстояние
+        перемещения массы между нормированными гистограммами (в корзинах).
+        """
+        a = self._values.astype(np.float64)
+        b = np.asarray(other, dtype=np.float64)
+        if method == "correl":
+            da = a - a.mean()
+            db = b - b.mean()
+            denom = np.sqrt((da * da).sum() * (db * db).sum())
+            return float((da * db).sum() / denom) if denom else 1.0
+        elif method == "chisqr":
+            nonzero = a != 0
+            diff = a[nonzero] - b[nonzero]
+            return float((diff * diff / a[nonzero]).sum())
+        elif method == "intersect":
+            return float(np.minimum(a, b).sum())
+        elif method == "bhattacharyya":
+            denom = np.sqrt(a.sum() * b.sum())
+            if not denom:
+                return 0.0
+            return float(np.sqrt(max(1.0 - np.sqrt(a * b).sum() / denom, 0.0)))
+        elif method == "emd":
+            ca = np.cumsum(a)
+            cb = np.cumsum(b)
+            ca = ca / ca[-1] if ca[-1] else ca
+            cb = cb / cb[-1] if cb[-1] else cb
+            return float(np.abs(ca - cb).sum())
+        else:
+            raise ValueError("Неизвестный метод сравнения гистограмм: %s" % method)
+
+    def __repr__(self):
+        return "Hist(sum=%g)" % self.sum()
 
 
 if __name__ == "__main__":
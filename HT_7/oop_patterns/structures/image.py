@@ -1,12 +1,121 @@
+import os
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
+import numpy as np
 
 """
-Абстрактная фабрика 
+Абстрактная фабрика
 """
 
+# флаги уменьшенного декодирования: базовый флаг -> {делитель: флаг}
+REDUCED_FLAGS = {
+    cv2.IMREAD_GRAYSCALE: {2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                           4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+                           8: cv2.IMREAD_REDUCED_GRAYSCALE_8},
+    cv2.IMREAD_COLOR: {2: cv2.IMREAD_REDUCED_COLOR_2,
+                       4: cv2.IMREAD_REDUCED_COLOR_4,
+                       8: cv2.IMREAD_REDUCED_COLOR_8},
+}
+
+
+def _jpeg_size(file):
+    file.seek(2)
+    while True:
+        marker = file.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        code = marker[1]
+        if code == 0xFF:
+            # байт-заполнитель перед маркером
+            file.seek(-1, 1)
+            continue
+        if code == 0x01 or 0xD0 <= code <= 0xD8:
+            continue
+        (length,) = struct.unpack(">H", file.read(2))
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            (height, width) = struct.unpack(">xHH", file.read(5))
+            return width, height
+        file.seek(length - 2, 1)
+
+
+def image_size(file_path):
+    """
+    Размер (ширина, высота) по заголовку PNG, JPEG или BMP без
+    декодирования; None для остальных форматов.
+    """
+    with open(file_path, "rb") as file:
+        head = file.read(26)
+        if head.startswith(b"\x89PNG\r\n\x1a\n"):
+            return struct.unpack(">II", head[16:24])
+        if head.startswith(b"BM"):
+            (width, height) = struct.unpack("<ii", head[18:26])
+            return width, abs(height)
+        if head.startswith(b"\xff\xd8"):
+            return _jpeg_size(file)
+    return None
+
+
+def reduction_factor(size, target_size):
+    """
+    Наибольший делитель из 2, 4, 8, при котором изображение размера
+    size = (w, h) остается не меньше target_size = (w, h); 1, если такого нет.
+    """
+    (width, height) = size
+    (target_width, target_height) = target_size
+    for factor in (8, 4, 2):
+        if -(-width // factor) >= target_width and -(-height // factor) >= target_height:
+            return factor
+    return 1
+
+
+def read_image_file(file_path, flags, dst=None):
+    """
+    cv2.imread с проверкой, что файл действительно декодирован;
+    иначе RuntimeError. Если dst того же размера и типа, изображение
+    копируется в него и возвращается dst.
+    Прямо в dst не декодируется: при ошибке cv2.imread(path, dst, flags)
+    возвращает тот же dst с прошлым изображением, и неудачу нельзя
+    отличить от успеха.
+    """
+    image = cv2.imread(file_path, flags)
+    if image is None or image.size == 0:
+        raise RuntimeError(f"Не удалось открыть файл {file_path}")
+    if dst is not None and dst.shape == image.shape and dst.dtype == image.dtype \
+            and dst.flags.writeable:
+        np.copyto(dst, image)
+        return dst
+    return image
+
 
 class AbstractFactoryImageReader:
-    def read_image(self, file_path):
+    # флаг cv2.imread для полного размера
+    FLAGS = cv2.IMREAD_GRAYSCALE
+
+    def __init__(self, target_size=None):
+        """
+        target_size — (ширина, высота), которые нужны потребителю:
+        если изображение в 2, 4 или 8 раз больше, оно декодируется
+        сразу уменьшенным (IMREAD_REDUCED_*), что для JPEG заметно быстрее.
+        """
+        self.target_size = target_size
+
+    def _flags(self, file_path):
+        if self.target_size is None:
+            return self.FLAGS
+        size = image_size(file_path)
+        if size is None:
+            return self.FLAGS
+        factor = reduction_factor(size, self.target_size)
+        return REDUCED_FLAGS[self.FLAGS].get(factor, self.FLAGS)
+
+    def read_image(self, file_path, dst=None):
+        """
+        dst — буфер прошлого результата; если он того же размера,
+        изображение копируется в него (см. read_image_file).
+        """
         raise NotImplementedError()
 
 
@@ -15,45 +124,223 @@ class BinImageReader(AbstractFactoryImageReader):
     Чтение бинарного изображения:
     читаем в оттенках серого и порогом преобразуем к 0/255.
     """
-    def read_image(self, file_path):
-        gray = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
-        if gray is None:
-            raise RuntimeError(f"Не удалось открыть файл {file_path}")
-        _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        return binary
+    def read_image(self, file_path, dst=None):
+        gray = read_image_file(file_path, self._flags(file_path), dst)
+        # порог на месте, без второго массива
+        cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, gray)
+        return gray
 
 
 class MonochromeImageReader(AbstractFactoryImageReader):
     """
     Чтение монохромного (градации серого) изображения.
     """
-    def read_image(self, file_path):
-        image = cv2.imread(file_path, cv2.IMREAD_GRAYSCALE)
-        if image is None:
-            raise RuntimeError(f"Не удалось открыть файл {file_path}")
-        return image
+    def read_image(self, file_path, dst=None):
+        return read_image_file(file_path, self._flags(file_path), dst)
 
 
 class ColorImageReader(AbstractFactoryImageReader):
     """
     Чтение цветного изображения (BGR).
     """
-    def read_image(self, file_path):
-        image = cv2.imread(file_path, cv2.IMREAD_COLOR)
-        if image is None:
-            raise RuntimeError(f"Не удалось открыть файл {file_path}")
+    FLAGS = cv2.IMREAD_COLOR
+
+    def read_image(self, file_path, dst=None):
+        return read_image_file(file_path, self._flags(file_path), dst)
+
+
+class PooledImageReader(AbstractFactoryImageReader):
+    """
+    Обертка над ридером: кольцо из buffers + prefetch выходных буферов,
+    которые переиспользуются при одинаковом размере изображений, и
+    фоновое декодирование следующих файлов в пуле потоков.
+
+    Результат read_image действителен, пока не прочитаны следующие
+    buffers изображений: потом его буфер займет другой файл.
+    """
+    def __init__(self, reader, buffers=2, prefetch=2, workers=None):
+        if buffers < 1 or prefetch < 0:
+            raise ValueError("buffers должен быть положительным, prefetch — неотрицательным")
+        self._reader = reader
+        self._prefetch = prefetch
+        self._slots = [None] * (buffers + prefetch)
+        self._next_slot = 0
+        self._pending = deque()
+        self._upcoming = iter(())
+        self._executor = ThreadPoolExecutor(workers or max(prefetch, 1)) if prefetch else None
+
+    @property
+    def target_size(self):
+        return self._reader.target_size
+
+    def _take_slot(self):
+        slot = self._next_slot
+        self._next_slot = (slot + 1) % len(self._slots)
+        return slot
+
+    def _decode(self, file_path, slot):
+        image = self._reader.read_image(file_path, self._slots[slot])
+        self._slots[slot] = image
         return image
 
+    def _fill(self):
+        while len(self._pending) < self._prefetch:
+            file_path = next(self._upcoming, None)
+            if file_path is None:
+                break
+            slot = self._take_slot()
+            self._pending.append(
+                (file_path, self._executor.submit(self._decode, file_path, slot)))
 
-def get_image_reader(ident):
-    if ident == 0:
-        return BinImageReader()
-    elif ident == 1:
-        return MonochromeImageReader()
-    elif ident == 2:
-        return ColorImageReader()
-    else:
+    def _drop_pending(self):
+        while self._pending:
+            self._pending.popleft()[1].exception()
+        self._upcoming = iter(())
+
+    def prefetch(self, file_paths):
+        """
+        Файлы, которые будут запрошены следующими, по порядку:
+        до prefetch из них декодируются заранее. Если read_image
+        запросит другой файл, предзагрузка сбрасывается.
+        """
+        self._drop_pending()
+        if self._executor is not None:
+            self._upcoming = iter(file_paths)
+            self._fill()
+
+    def read_image(self, file_path, dst=None):
+        if self._pending and self._pending[0][0] == file_path:
+            image = self._pending.popleft()[1].result()
+            self._fill()
+            return image
+        if self._pending:
+            self._drop_pending()
+        return self._decode(file_path, self._take_slot())
+
+    def iter_images(self, file_paths):
+        """
+        Генератор (path, image) с предзагрузкой следующих файлов.
+        """
+        file_paths = list(file_paths)
+        self.prefetch(file_paths)
+        for file_path in file_paths:
+            yield file_path, self.read_image(file_path)
+
+    def close(self):
+        self._drop_pending()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+
+class RawFrameReader(AbstractFactoryImageReader):
+    """
+    Чтение несжатых кадров uint8 без копирования: файл .npy или сырой
+    дамп (.raw) без заголовка, в котором подряд лежат кадры frame_shape —
+    (h, w) для серых или (h, w, 3) для BGR. В одном файле может быть
+    как один кадр, так и стопка из многих.
+
+    Кадры отдаются видами np.memmap только для чтения и приводятся к виду,
+    который ждет анализатор (ident как у get_image_reader). Копия нужна
+    только для бинаризации и смены числа каналов — она пишется в dst.
+    """
+    def __init__(self, ident, frame_shape=None):
+        super().__init__()
+        if ident not in _READER_CLASSES:
+            raise ValueError("Неизвестный идентификатор ридера изображения: %s" % ident)
+        self.ident = ident
+        self.frame_shape = None if frame_shape is None else tuple(frame_shape)
+
+    def open_stack(self, file_path):
+        """
+        Все кадры файла — np.memmap N x h x w или N x h x w x 3.
+        """
+        if file_path.lower().endswith(".npy"):
+            stack = np.load(file_path, mmap_mode="r")
+            if stack.ndim == 2 or (stack.ndim == 3 and stack.shape[2] == 3):
+                stack = stack[np.newaxis]
+        else:
+            if self.frame_shape is None:
+                raise ValueError("Для сырого файла %s нужен frame_shape" % file_path)
+            frame_size = int(np.prod(self.frame_shape))
+            count = os.path.getsize(file_path) // frame_size
+            if count == 0:
+                raise RuntimeError("Файл %s короче одного кадра" % file_path)
+            stack = np.memmap(file_path, dtype=np.uint8, mode="r",
+                              shape=(count,) + self.frame_shape)
+        if stack.dtype != np.uint8 or stack.ndim not in (3, 4) \
+                or (stack.ndim == 4 and stack.shape[3] != 3):
+            raise RuntimeError("Файл %s не является стопкой кадров uint8" % file_path)
+        return stack
+
+    def convert(self, frame, dst=None):
+        """
+        Кадр стопки в виде, нужном ридеру ident.
+        """
+        if self.ident == 2:
+            if frame.ndim == 3:
+                return frame
+            return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR, dst)
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst)
+            dst = frame
+        if self.ident == 1:
+            return frame
+        if dst is None or dst.shape != frame.shape or not dst.flags.writeable:
+            dst = np.empty(frame.shape, dtype=np.uint8)
+        _, binary = cv2.threshold(frame, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU, dst)
+        return binary
+
+    def read_frame(self, file_path, index, dst=None):
+        return self.convert(self.open_stack(file_path)[index], dst)
+
+    def read_image(self, file_path, dst=None):
+        return self.read_frame(file_path, 0, dst)
+
+    def frames(self, file_path):
+        """
+        Генератор кадров стопки; буфер преобразования переиспользуется,
+        поэтому кадр действителен до следующего шага.
+        """
+        stack = self.open_stack(file_path)
+        buf = None
+        for frame in stack:
+            buf = self.convert(frame, buf)
+            yield buf
+
+
+# ридеры без параметров не хранят состояния и общие для всех
+_shared_readers = {}
+
+_READER_CLASSES = {
+    0: BinImageReader,
+    1: MonochromeImageReader,
+    2: ColorImageReader,
+}
+
+
+def get_image_reader(ident, target_size=None, pooled=False, buffers=2, prefetch=2,
+                     raw=False, frame_shape=None):
+    """
+    Ридер по идентификатору: 0 — бинарное, 1 — монохромное, 2 — цветное.
+    target_size — см. AbstractFactoryImageReader; при pooled=True ридер
+    оборачивается в PooledImageReader(buffers, prefetch), который
+    создается заново при каждом вызове.
+    raw=True — RawFrameReader для несжатых кадров .npy/.raw (frame_shape
+    нужен для .raw), отдающий кадры без копирования.
+    """
+    if ident not in _READER_CLASSES:
         raise ValueError("Неизвестный идентификатор ридера изображения: %s" % ident)
+    if raw:
+        reader = RawFrameReader(ident, frame_shape)
+    elif target_size is None:
+        if ident not in _shared_readers:
+            _shared_readers[ident] = _READER_CLASSES[ident]()
+        reader = _shared_readers[ident]
+    else:
+        reader = _READER_CLASSES[ident](target_size)
+    if pooled:
+        return PooledImageReader(reader, buffers, prefetch)
+    return reader
 
 
 if __name__ == "__main__":
@@ -0,0 +1,80 @@
+import cv2
+import numpy as np
+
+"""
+Параметры объектов в виде структурированного массива NumPy.
+"""
+
+
+OBJECT_DTYPE = np.dtype([
+    ("label", np.int32),
+    ("x", np.int32),
+    ("y", np.int32),
+    ("w", np.int32),
+    ("h", np.int32),
+    ("area", np.int32),
+    ("cx", np.float64),
+    ("cy", np.float64),
+])
+
+
+class ObjectStats:
+    """
+    Параметры найденных объектов: по одной записи OBJECT_DTYPE на объект.
+
+    Для совместимости с прежним интерфейсом распаковывается
+    как пять колонок: (x, y, w, h, area) = stats.
+    """
+
+    def __init__(self, records):
+        records = np.asarray(records)
+        if records.dtype != OBJECT_DTYPE:
+            raise ValueError("Ожидается массив с dtype OBJECT_DTYPE")
+        self._records = records
+
+    @classmethod
+    def from_components(cls, stats, centroids):
+        """
+        Построение по результату cv2.connectedComponentsWithStats
+        срезами массивов, без цикла по объектам. Фон (метка 0) отбрасывается.
+        """
+        n = max(stats.shape[0] - 1, 0)
+        records = np.empty(n, dtype=OBJECT_DTYPE)
+        records["label"] = np.arange(1, n + 1)
+        records["x"] = stats[1:, cv2.CC_STAT_LEFT]
+        records["y"] = stats[1:, cv2.CC_STAT_TOP]
+        records["w"] = stats[1:, cv2.CC_STAT_WIDTH]
+        records["h"] = stats[1:, cv2.CC_STAT_HEIGHT]
+        records["area"] = stats[1:, cv2.CC_STAT_AREA]
+        records["cx"] = centroids[1:, 0]
+        records["cy"] = centroids[1:, 1]
+        return cls(records)
+
+    @property
+    def records(self):
+        return self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        for name in ("x", "y", "w", "h", "area"):
+            yield self._records[name]
+
+    def __getitem__(self, key):
+        """
+        stats["area"] — колонка, stats[mask] или stats[1:5] — подвыборка объектов.
+        """
+        if isinstance(key, str):
+            return self._records[key]
+        return ObjectStats(np.atleast_1d(self._records[key]))
+
+    def filter_area(self, min_area, max_area):
+        """
+        Объекты с min_area < area < max_area.
+        """
+        area = self._records["area"]
+        return self[(area > min_area) & (area < max_area)]
+
+    def __repr__(self):
+        return "ObjectStats(%d objects)" % len(self)
@@ -0,0 +1,35 @@
+import cv2
+import numpy as np
+import pytest
+
+import algorithms.object_analysis
+from algorithms.cache import CachedAnalysis, ResultCache
+
+
+def make_image():
+    image = np.zeros((120, 160), np.uint8)
+    for x, y, r in ((30, 30, 10), (100, 60, 15), (60, 95, 8)):
+        cv2.circle(image, (x, y), r, 255, -1)
+    return image
+
+
+def test_cache_around_composed_analyzer_counts_hits(tmp_path):
+    image = make_image()
+    cache = ResultCache(str(tmp_path))
+    analyzer = CachedAnalysis(
+        algorithms.object_analysis.FilteredAnalysis(
+            algorithms.object_analysis.BinaryImage(), min_area=1), cache)
+    first = analyzer.template_method(image)
+    second = analyzer.template_method(image)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert np.array_equal(first.records, second.records)
+    assert len(second) == 3
+
+
+def test_decorator_over_cache_is_rejected(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    analyzer = algorithms.object_analysis.FilteredAnalysis(
+        CachedAnalysis(algorithms.object_analysis.BinaryImage(), cache))
+    with pytest.raises(RuntimeError):
+        analyzer.template_method(make_image())
+    assert (cache.hits, cache.misses) == (0, 0)
@@ -7,43 +7,133 @@ import algorithms.object_analysis
 
 
 class IPPrototype(object):
+    """
+    Набор именованных обработчиков (ObjectAnalysis).
+
+    clone() по умолчанию дешевый (копирование при записи): клон делит
+    с оригиналом словарь обработчиков, а обработчик копируется только
+    при первом get_processor. Копия поверхностная (copy.copy):
+    неизменяемые данные (ядра, описания, таблицы) остаются общими,
+    а изменяемое состояние прогона сбрасывается их __copy__
+    (см. PipelineAnalysis, FilteredAnalysis, CachedAnalysis).
+    Стоимость клонирования не зависит от объема этих данных.
+    """
     def __init__(self):
         self._processors = {}
+        self._owned = True
+        # обработчики, уже скопированные этим клоном
+        self._copied = None
 
     def processors_list(self):
         return self._processors.keys()
 
+    def get_processor(self, name):
+        proc = self._processors[name]
+        if self._copied is not None and name not in self._copied:
+            self._own()
+            proc = self._processors[name] = copy.copy(proc)
+            self._copied.add(name)
+        return proc
+
+    def _own(self):
+        if not self._owned:
+            self._processors = dict(self._processors)
+            self._owned = True
+
     def add_processor(self, name, proc):
+        self._own()
         self._processors[name] = proc
+        if self._copied is not None:
+            self._copied.add(name)
 
     def delete_processor(self, name):
+        self._own()
         del self._processors[name]
 
-    def clone(self):
-        return copy.deepcopy(self)
+    def clone(self, deep=False):
+        """
+        deep=True — полная независимая копия через copy.deepcopy.
+        """
+        if deep:
+            return copy.deepcopy(self)
+        clone = IPPrototype()
+        if self._copied is None:
+            clone._processors = self._processors
+            clone._copied = set()
+            # словарь теперь общий: оригинал тоже копирует его при записи
+            self._owned = False
+        else:
+            # клон клона: общими можно оставить только еще не скопированные
+            clone._processors = {name: copy.copy(proc) if name in self._copied else proc
+                                 for name, proc in self._processors.items()}
+            clone._copied = set(self._copied)
+        clone._owned = False
+        return clone
+
+    def warm_up(self, images):
+        """
+        Прогон обработчиков на образцах images (по ридеру каждого —
+        словарь {reader_ident: изображение}).
+        Своих ленивых данных у обработчиков нет: ядра, описания и
+        скомпилированные стадии строятся при создании и уже общие
+        с клонами. Прогревается состояние процесса, которое тоже делят
+        все клоны воркера: первый вызов функций OpenCV (инициализация
+        пула потоков и выбор реализаций) заметно медленнее следующих.
+        Прогоняются копии, поэтому буферы прогона в прототип не попадают.
+        """
+        for proc in self._processors.values():
+            image = images.get(proc.reader_ident)
+            if image is not None:
+                copy.copy(proc).template_method(image)
 
 
 class PrototypeFactory:
+    """
+    Реестр прогретых прототипов. Реестр свой в каждом процессе-воркере:
+    прототип собирается и прогревается (IPPrototype.warm_up) один раз,
+    а каждый запрос получает его дешевый клон.
+    """
+
+    __registry = {}
 
-    __bia = None
-    __mia = None
+    @staticmethod
+    def register(name, prototype, warm_images=None):
+        if warm_images:
+            prototype.warm_up(warm_images)
+        PrototypeFactory.__registry[name] = prototype
 
     @staticmethod
-    def initialize():
-        PrototypeFactory.__bia = IPPrototype()
-        PrototypeFactory.__bia.add_processor('bin_image1', algorithms.object_analysis.BinaryImage())
-        PrototypeFactory.__bia.add_processor('bin_image2', algorithms.object_analysis.BinaryImage())
+    def unregister(name):
+        PrototypeFactory.__registry.pop(name, None)
 
-        PrototypeFactory.__mia = IPPrototype()
-        PrototypeFactory.__mia.add_processor('mono_image', algorithms.object_analysis.MonochromeImage())
+    @staticmethod
+    def names():
+        return list(PrototypeFactory.__registry)
+
+    @staticmethod
+    def get(name, deep=False):
+        if name not in PrototypeFactory.__registry:
+            raise ValueError("Неизвестный прототип: %s" % name)
+        return PrototypeFactory.__registry[name].clone(deep)
+
+    @staticmethod
+    def initialize(warm_images=None):
+        bia = IPPrototype()
+        bia.add_processor('bin_image1', algorithms.object_analysis.BinaryImage())
+        bia.add_processor('bin_image2', algorithms.object_analysis.BinaryImage())
+        PrototypeFactory.register('bia', bia, warm_images)
+
+        mia = IPPrototype()
+        mia.add_processor('mono_image', algorithms.object_analysis.MonochromeImage())
+        PrototypeFactory.register('mia', mia, warm_images)
 
     @staticmethod
     def getBIAPrototype():
-        return PrototypeFactory.__bia.clone()
+        return PrototypeFactory.get('bia')
 
     @staticmethod
     def getMIAPrototype():
-        return PrototypeFactory.__mia.clone()
+        return PrototypeFactory.get('mia')
 
 
 if __name__=="__main__":
@@ -51,4 +141,3 @@ if __name__=="__main__":
 
     print(PrototypeFactory.getBIAPrototype().processors_list())
     print(PrototypeFactory.getMIAPrototype().processors_list())
-
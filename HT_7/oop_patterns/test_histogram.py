@@ -0,0 +1,116 @@
+import asyncio
+import builtins
+
+import numpy as np
+import pytest
+
+import structures.codecs
+from structures.histogram import Hist
+
+
+def make_hist():
+    return Hist(np.arange(Hist.BINS, dtype=float))
+
+
+def test_array_copy_is_writeable_and_independent():
+    hist = make_hist()
+    values = np.array(hist, copy=True)
+    assert values.flags.writeable
+    assert not np.shares_memory(values, np.asarray(hist))
+    values[0] = -1
+    assert hist[0] == 0
+
+
+def test_array_without_copy_shares_read_only_values():
+    hist = make_hist()
+    values = np.asarray(hist)
+    assert not values.flags.writeable
+    assert np.shares_memory(values, np.asarray(hist))
+
+
+def test_array_dtype_conversion():
+    hist = make_hist()
+    values = np.asarray(hist, dtype=np.float32)
+    assert values.dtype == np.float32
+    assert np.array_equal(values, np.arange(Hist.BINS))
+    with pytest.raises(ValueError):
+        np.array(hist, dtype=np.float32, copy=False)
+
+
+def test_registered_codecs_declare_bulk_paths():
+    assert structures.codecs.get_codec("hst").mmap
+    assert structures.codecs.get_codec("npy").mmap
+    for name in ("csv", "txt", "json", "bin", "png"):
+        assert structures.codecs.get_codec(name).streaming
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    # пути, открытые через open (в том числе из np.memmap)
+    paths = []
+    real_open = builtins.open
+
+    def counting_open(file, *args, **kwargs):
+        paths.append(str(file))
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "open", counting_open)
+    return paths
+
+
+def write_files(tmp_path):
+    values = np.arange(Hist.BINS, dtype=float)
+    paths = [str(tmp_path / name) for name in ("a.csv", "b.txt", "c.json", "d.bin")]
+    for path in paths:
+        Hist.write(path, values)
+    store = str(tmp_path / "e.hst")
+    Hist.write_many(store, {"e": values})
+    return paths + [store], values
+
+
+def test_read_opens_each_file_once(tmp_path, opened):
+    paths, values = write_files(tmp_path)
+    del opened[:]
+    for path in paths:
+        assert np.array_equal(Hist.read(path), values)
+    assert sorted(opened) == sorted(paths)
+
+
+def test_aread_many_opens_each_file_once(tmp_path, opened):
+    paths, values = write_files(tmp_path)
+    del opened[:]
+    hists = asyncio.run(Hist.aread_many(paths, limit=2))
+    assert all(np.array_equal(hist, values) for hist in hists)
+    assert sorted(opened) == sorted(paths)
+
+
+def mapped(values):
+    while values is not None:
+        if isinstance(values, np.memmap):
+            return True
+        values = values.base
+    return False
+
+
+def test_read_many_uses_registered_mmap_flag(tmp_path, monkeypatch):
+    store = str(tmp_path / "store.hst")
+    Hist.write_many(store, {"a": np.ones(Hist.BINS), "b": np.zeros(Hist.BINS)})
+    assert mapped(Hist.read_many(store)["a"].values)
+    monkeypatch.setattr(structures.codecs.get_codec("hst"), "mmap", False)
+    hists = Hist.read_many(store)
+    assert not mapped(hists["a"].values)
+    assert hists["a"].sum() == Hist.BINS and hists["b"].sum() == 0
+
+
+def test_read_text_many_in_batches(tmp_path):
+    paths = []
+    for i in range(5):
+        path = tmp_path / ("%d.txt" % i)
+        path.write_text("0 %d\n255 1\n" % i if i != 3 else "0 1\nbad line here\n")
+        paths.append(str(path))
+    whole, whole_errors = Hist.read_text_many(paths)
+    matrix, errors = Hist.read_text_many(paths, batch=2)
+    assert np.array_equal(matrix, whole)
+    assert errors == whole_errors
+    assert [(error.path, error.line) for error in errors] == [(paths[3], 2)]
+    assert list(matrix[:, 0]) == [0, 1, 2, 1, 4]
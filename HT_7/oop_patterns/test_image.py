@@ -0,0 +1,39 @@
+import cv2
+import numpy as np
+import pytest
+
+from structures.image import get_image_reader
+
+
+def write_images(tmp_path):
+    image = np.random.default_rng(0).integers(0, 256, (60, 80, 3)).astype(np.uint8)
+    good = str(tmp_path / "good.jpg")
+    cv2.imwrite(good, image)
+    junk = tmp_path / "junk.jpg"
+    junk.write_bytes(b"junk" * 100)
+    # заголовок JPEG цел, данные испорчены
+    data = (tmp_path / "good.jpg").read_bytes()
+    corrupt = tmp_path / "corrupt.jpg"
+    corrupt.write_bytes(data[:400] + bytes(len(data) - 400))
+    return good, str(junk), str(corrupt)
+
+
+@pytest.mark.parametrize("ident", [0, 1, 2])
+def test_pooled_reader_raises_on_bad_file_after_good_one(tmp_path, ident):
+    good, junk, corrupt = write_images(tmp_path)
+    reader = get_image_reader(ident, pooled=True, buffers=1, prefetch=0)
+    for bad in (junk, corrupt, str(tmp_path / "missing.jpg")):
+        reader.read_image(good)
+        with pytest.raises(RuntimeError):
+            reader.read_image(bad)
+    reader.close()
+
+
+def test_pooled_reader_reuses_buffer_for_same_size(tmp_path):
+    good, _, _ = write_images(tmp_path)
+    reader = get_image_reader(2, pooled=True, buffers=1, prefetch=0)
+    first = reader.read_image(good)
+    second = reader.read_image(good)
+    assert second is first
+    assert np.array_equal(second, cv2.imread(good, cv2.IMREAD_COLOR))
+    reader.close()
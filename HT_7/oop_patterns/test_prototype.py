@@ -0,0 +1,39 @@
+import numpy as np
+
+from algorithms.object_analysis import BinaryImage
+from algorithms.pipeline import PipelineAnalysis
+from test_env.prototype import IPPrototype, PrototypeFactory
+
+
+class CountingAnalysis(BinaryImage):
+    runs = 0
+
+    def template_method(self, image):
+        CountingAnalysis.runs += 1
+        return super().template_method(image)
+
+
+def test_warm_up_keeps_prototype_clean():
+    prototype = IPPrototype()
+    prototype.add_processor("pipeline", PipelineAnalysis.from_preset("binary"))
+    prototype.add_processor("counting", CountingAnalysis())
+    CountingAnalysis.runs = 0
+    PrototypeFactory.register("warm", prototype, {0: np.zeros((32, 32), np.uint8)})
+    try:
+        assert CountingAnalysis.runs == 1
+        # буферы прогона остались у копий, прототип и клоны начинают с пустых
+        assert prototype.get_processor("pipeline")._buffers == [None, None]
+        clone = PrototypeFactory.get("warm")
+        pipeline = clone.get_processor("pipeline")
+        assert pipeline._buffers == [None, None]
+        assert pipeline._segmentation is prototype.get_processor("pipeline")._segmentation
+    finally:
+        PrototypeFactory.unregister("warm")
+
+
+def test_warm_up_skips_readers_without_images():
+    prototype = IPPrototype()
+    prototype.add_processor("counting", CountingAnalysis())
+    CountingAnalysis.runs = 0
+    prototype.warm_up({1: np.zeros((32, 32), np.uint8)})
+    assert CountingAnalysis.runs == 0
@@ -0,0 +1,32 @@
+import cv2
+import numpy as np
+import pytest
+
+import algorithms.object_analysis
+from algorithms.stream import ImageSequenceSource, StreamAnalysis
+
+
+def write_sequence(tmp_path):
+    image = np.random.default_rng(0).integers(0, 256, (60, 80, 3)).astype(np.uint8)
+    cv2.imwrite(str(tmp_path / "1.jpg"), image)
+    (tmp_path / "2.jpg").write_bytes(b"junk" * 100)
+    cv2.imwrite(str(tmp_path / "3.jpg"), image)
+
+
+def test_image_sequence_raises_on_bad_file_instead_of_repeating_frame(tmp_path):
+    write_sequence(tmp_path)
+    source = ImageSequenceSource(str(tmp_path))
+    frame = source.read(None)
+    assert frame is not None
+    with pytest.raises(RuntimeError):
+        source.read(frame)
+
+
+def test_stream_analysis_stops_on_bad_file(tmp_path):
+    write_sequence(tmp_path)
+    stream = StreamAnalysis(algorithms.object_analysis.BinaryImage())
+    results = []
+    with pytest.raises(RuntimeError):
+        for index, objects, latency in stream.run(ImageSequenceSource(str(tmp_path))):
+            results.append(index)
+    assert results == [0]
@@ -0,0 +1,41 @@
+import cv2
+import numpy as np
+import pytest
+
+from algorithms.object_analysis import ColorImage, FilteredAnalysis
+
+
+def synthetic(height=700, width=900, count=150, seed=2):
+    rng = np.random.default_rng(seed)
+    image = np.full((height, width, 3), 30, np.uint8)
+    for _ in range(count):
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        color = tuple(int(v) for v in rng.integers(150, 255, 3))
+        cv2.circle(image, center, int(rng.integers(6, 22)), color, -1)
+    return image
+
+
+@pytest.mark.parametrize("tile_size", [128, 200, 333])
+def test_tiled_matches_whole_image_in_order(tile_size):
+    image = synthetic()
+    whole = ColorImage().template_method(image).records
+    tiled = ColorImage(tile_size=tile_size, overlap=64).template_method(image).records
+    assert len(whole) > 10
+    for name in ("label", "x", "y", "w", "h", "area"):
+        assert np.array_equal(whole[name], tiled[name])
+    assert np.allclose(whole["cx"], tiled["cx"])
+    assert np.allclose(whole["cy"], tiled["cy"])
+
+
+def test_whole_image_labels_follow_raster_order():
+    image = synthetic()
+    (mask, (n, labels, stats, centroids)) = ColorImage().segmentation(image)
+    first = [np.flatnonzero(labels == label)[0] for label in range(1, n)]
+    assert first == sorted(first)
+    for label in range(1, n):
+        ys, xs = np.nonzero(labels == label)
+        assert (xs.min(), ys.min()) == tuple(stats[label, :2])
+    # карта меток и объекты согласованы и для декоратора
+    filtered = FilteredAnalysis(ColorImage())
+    filtered.template_method(image)
+    assert filtered.hu_moments is not None
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+from convolution import correlate_valid, filter_image, filter_parallel, filter_tiled, tile_size
+from main_func import gaussian_kernel, gaussian_kernel_1d
+
+
+# --------- замеры времени фильтров ---------
+# запуск: python benchmark_filters.py [высота ширина]
+
+def best_time(func, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_separable(image, sizes=range(3, 32, 2)):
+    # плотная свёртка (прямая и FFT) против двух одномерных проходов
+    print("%-4s %10s %10s %10s %8s" % ("K", "direct", "fft", "separable", "speedup"))
+    for size in sizes:
+        sigma = size / 6
+        kernel = gaussian_kernel(size, sigma)
+        parts = (gaussian_kernel_1d(size, sigma), gaussian_kernel_1d(size, sigma))
+        direct = best_time(lambda: correlate_valid(image, kernel, "direct"))
+        fft = best_time(lambda: correlate_valid(image, kernel, "fft"))
+        separable = best_time(lambda: correlate_valid(image, parts, "separable"))
+        print("%-4d %9.3fs %9.3fs %9.3fs %7.1fx" % (
+            size, direct, fft, separable, min(direct, fft) / separable))
+
+def bench_tiled(image, sizes=(5, 15), orders=("linear", "spiral", "zigzag", "hilbert", "peano")):
+    # целое изображение за раз против плиток под L2-кэш в разных порядках обхода
+    for size in sizes:
+        kernel = gaussian_kernel(size, size / 6)
+        parts = (gaussian_kernel_1d(size, size / 6),) * 2
+        for name, k, method in (("direct", kernel, "direct"), ("separable", parts, "separable")):
+            whole = best_time(lambda: filter_image(image, k, method))
+            print("K=%d %s, плитка %d: целиком %.3fs" % (size, name, tile_size((size, size)), whole))
+            for order in orders:
+                tiled = best_time(lambda: filter_tiled(image, k, order, method=method))
+                print("    %-8s %9.3fs %7.2fx" % (order, tiled, whole / tiled))
+
+def bench_parallel(image, size=5, workers=(1, 2, 4, 8)):
+    # полосы в пуле потоков прямо в готовый float32-буфер; ускорение
+    # ограничено числом ядер (os.cpu_count())
+    kernel = gaussian_kernel(size, size / 6)
+    out = np.empty(image.shape, dtype=np.float32)
+    whole = best_time(lambda: filter_image(image, kernel))
+    print("K=%d, ядер %d: filter_image %.3fs" % (size, os.cpu_count() or 1, whole))
+    for count in workers:
+        parallel = best_time(lambda: filter_parallel(image, kernel, count, out=out))
+        print("    потоков %-3d %9.3fs %7.2fx" % (count, parallel, whole / parallel))
+
+
+if __name__ == '__main__':
+    h,w = (int(sys.argv[1]), int(sys.argv[2])) if len(sys.argv) > 2 else (1080, 1920)
+    image = np.random.randint(0, 256, (h,w)).astype(float)
+    print("Изображение %dx%d" % (h,w))
+    bench_separable(image)
+    bench_tiled(image)
+    bench_parallel(image)
@@ -0,0 +1,39 @@
+import time
+
+from main_func import hilbert_curve
+from traversal import hilbert_order, iterate_chunks, peano_order
+
+
+# --------- замеры порядков обхода ---------
+# рекурсивная hilbert_curve против векторных порядков traversal
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def bench_hilbert(sizes=(256, 512, 1024)):
+    print("%-10s %10s %10s %10s" % ("размер", "рекурсия", "массив", "из кэша"))
+    for n in sizes:
+        order = n.bit_length() - 1
+        recursive = timed(lambda: sum(1 for _ in hilbert_curve(0,0,n,0,0,n,order)))
+        hilbert_order.cache_clear()
+        array = timed(lambda: hilbert_order(n,n))
+        cached = timed(lambda: hilbert_order(n,n))
+        print("%-10s %9.3fs %9.3fs %9.6fs" % ("%dx%d" % (n,n), recursive, array, cached))
+
+def bench_rectangles(sizes=((1080, 1920), (720, 1280), (1000, 1000))):
+    # для таких размеров рекурсивной версии нет
+    print("%-10s %10s %10s %10s" % ("размер", "гильберт", "пеано", "по частям"))
+    for h,w in sizes:
+        hilbert_order.cache_clear()
+        peano_order.cache_clear()
+        hilbert = timed(lambda: hilbert_order(h,w))
+        peano = timed(lambda: peano_order(h,w))
+        chunks = timed(lambda: sum(len(rows) for rows, cols in iterate_chunks(hilbert_order(h,w), w)))
+        print("%-10s %9.3fs %9.3fs %9.3fs" % ("%dx%d" % (h,w), hilbert, peano, chunks))
+
+
+if __name__ == '__main__':
+    bench_hilbert()
+    bench_rectangles()
@@ -0,0 +1,188 @@
+import numpy as np
+
+
+# --------- преобразования цветовых пространств ---------
+# Каждое преобразование аффинное: пиксель (последняя ось, C каналов)
+# умножается на матрицу K x C и сдвигается на offset. Изображение (h, w, C)
+# и пачка кадров (n, h, w, C) считаются как один массив пикселей N x C
+# матричным умножением.
+# Канал 0 — R (порядок RGB, не BGR как в OpenCV).
+
+# яркость по BT.601 (как в main_func.rgb_to_gray)
+RGB_TO_GRAY = [[0.299, 0.587, 0.114]]
+
+GRAY_TO_RGB = [[1.0], [1.0], [1.0]]
+
+# те же матрицы, что в HT_3/4.py
+RGB_TO_YIQ = [
+    [0.299, 0.587, 0.114],
+    [0.596, -0.274, -0.322],
+    [0.211, -0.523, 0.312]
+]
+
+YIQ_TO_RGB = [
+    [1.000, 0.956, 0.621],
+    [1.000, -0.272, -0.647],
+    [1.000, -1.106, 1.703]
+]
+
+# YCrCb для значений 0..255, как cv2.COLOR_RGB2YCrCb:
+# Cr = (R - Y) * 0.713 + 128, Cb = (B - Y) * 0.564 + 128
+RGB_TO_YCRCB = [
+    [0.299, 0.587, 0.114],
+    [0.500, -0.419, -0.081],
+    [-0.169, -0.331, 0.500]
+]
+YCRCB_OFFSET = [0.0, 128.0, 128.0]
+
+YCRCB_TO_RGB = [
+    [1.000, 1.403, 0.000],
+    [1.000, -0.714, -0.344],
+    [1.000, 0.000, 1.773]
+]
+# сдвиг обратного преобразования: -YCRCB_TO_RGB @ YCRCB_OFFSET
+RGB_FROM_YCRCB_OFFSET = [-179.584, 135.424, -226.944]
+
+# (откуда, куда) -> (матрица, сдвиг)
+CONVERSIONS = {
+    ("rgb", "gray"): (RGB_TO_GRAY, None),
+    ("gray", "rgb"): (GRAY_TO_RGB, None),
+    ("rgb", "yiq"): (RGB_TO_YIQ, None),
+    ("yiq", "rgb"): (YIQ_TO_RGB, None),
+    ("rgb", "ycrcb"): (RGB_TO_YCRCB, YCRCB_OFFSET),
+    ("ycrcb", "rgb"): (YCRCB_TO_RGB, RGB_FROM_YCRCB_OFFSET),
+}
+
+# преобразования, результат которых для входа 0..255 тоже лежит в 0..255
+# (после обрезки) — для них есть целочисленный путь convert_uint8
+UINT8_CONVERSIONS = {("rgb", "gray"), ("gray", "rgb"), ("rgb", "ycrcb"), ("ycrcb", "rgb")}
+
+# число дробных бит коэффициентов в целочисленном пути
+FIXED_SHIFT = 14
+
+# пикселей в куске: вход обрабатывается кусками через буферы, которые
+# остаются в кэше (вещественный путь — приведение типа и умножение
+# через BLAS, целочисленный — накопление в int32)
+CHUNK_PIXELS = 65536
+
+
+def _conversion(src, dst):
+    if (src, dst) not in CONVERSIONS:
+        raise ValueError("Неизвестное преобразование: %s -> %s" % (src, dst))
+    matrix, offset = CONVERSIONS[(src, dst)]
+    return np.array(matrix, dtype=float), None if offset is None else np.array(offset)
+
+
+def _shapes(image, matrix):
+    # вход как (..., C) и форма результата: у одноканального нет оси каналов
+    k, c = matrix.shape
+    image = np.asarray(image)
+    pixels = image[..., None] if c == 1 else image
+    if pixels.shape[-1] != c:
+        raise ValueError("Ожидается %d канала в последней оси, получено %d"
+                         % (c, pixels.shape[-1]))
+    shape = pixels.shape[:-1] if k == 1 else pixels.shape[:-1] + (k,)
+    return pixels, shape
+
+
+def _check_out(out, shape, dtype):
+    if out is None:
+        return np.empty(shape, dtype=dtype)
+    if out.shape != shape:
+        raise ValueError("Размер out %s, нужен %s" % (out.shape, shape))
+    if not out.flags.c_contiguous:
+        raise ValueError("out должен быть непрерывным массивом")
+    return out
+
+
+def convert(image, src, dst, out=None, dtype=float):
+    """
+    Преобразование изображения или пачки кадров из src в dst
+    ("rgb", "gray", "yiq", "ycrcb") матричным умножением.
+    Результат пишется в out (если передан, любой вещественный тип
+    нужной формы) или в новый массив dtype. Значения не обрезаются.
+    """
+    matrix, offset = _conversion(src, dst)
+    pixels, shape = _shapes(image, matrix)
+    out = _check_out(out, shape, dtype)
+    k, c = matrix.shape
+    pixels = pixels.reshape(-1, c)
+    result = out.reshape(-1, k)
+    weights = matrix.T.astype(out.dtype)
+    # вход того же типа, что out, умножается как есть, иначе — через буфер
+    buf = None if pixels.dtype == out.dtype else np.empty((CHUNK_PIXELS, c), dtype=out.dtype)
+    for start in range(0, len(pixels), CHUNK_PIXELS):
+        stop = min(start + CHUNK_PIXELS, len(pixels))
+        chunk = pixels[start:stop]
+        if buf is not None:
+            chunk = buf[:stop - start]
+            chunk[...] = pixels[start:stop]
+        np.matmul(chunk, weights, out=result[start:stop])
+    if offset is not None:
+        result += offset.astype(out.dtype)
+    return out
+
+
+def _fixed(values):
+    return np.round(np.asarray(values) * (1 << FIXED_SHIFT)).astype(np.int32)
+
+
+def convert_uint8(image, src, dst, out=None):
+    """
+    Целочисленный путь для uint8: коэффициенты с фиксированной точкой
+    (FIXED_SHIFT дробных бит), накопление в int32, округление и обрезка
+    в 0..255. Отличие от round(convert(...)) — не больше 1.
+    """
+    if (src, dst) not in UINT8_CONVERSIONS:
+        raise ValueError("Преобразование %s -> %s не сводится к uint8" % (src, dst))
+    matrix, offset = _conversion(src, dst)
+    pixels, shape = _shapes(image, matrix)
+    if pixels.dtype != np.uint8:
+        raise ValueError("Ожидается изображение uint8")
+    out = _check_out(out, shape, np.uint8)
+    k, c = matrix.shape
+    pixels = pixels.reshape(-1, c)
+    result = out.reshape(-1, k)
+    weights = _fixed(matrix)
+    # сдвиг вместе с половиной младшего разряда для округления
+    bias = _fixed(np.zeros(k) if offset is None else offset) + (1 << (FIXED_SHIFT - 1))
+    acc = np.empty(CHUNK_PIXELS, dtype=np.int32)
+    term = np.empty_like(acc)
+    for start in range(0, len(pixels), CHUNK_PIXELS):
+        stop = min(start + CHUNK_PIXELS, len(pixels))
+        chunk = pixels[start:stop]
+        a, t = acc[:stop - start], term[:stop - start]
+        for row in range(k):
+            a[...] = bias[row]
+            for col in range(c):
+                if weights[row, col] != 0:
+                    np.multiply(chunk[:, col], weights[row, col], out=t, dtype=np.int32)
+                    a += t
+            a >>= FIXED_SHIFT
+            np.clip(a, 0, 255, out=a)
+            result[start:stop, row] = a
+    return out
+
+
+def rgb_to_gray(image, out=None):
+    return convert(image, "rgb", "gray", out)
+
+
+def gray_to_rgb(image, out=None):
+    return convert(image, "gray", "rgb", out)
+
+
+def rgb_to_yiq(image, out=None):
+    return convert(image, "rgb", "yiq", out)
+
+
+def yiq_to_rgb(image, out=None):
+    return convert(image, "yiq", "rgb", out)
+
+
+def rgb_to_ycrcb(image, out=None):
+    return convert(image, "rgb", "ycrcb", out)
+
+
+def ycrcb_to_rgb(image, out=None):
+    return convert(image, "ycrcb", "rgb", out)
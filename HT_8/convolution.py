@@ -0,0 +1,313 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from traversal import get_order, iterate_order
+
+
+# --------- векторная свёртка ---------
+# Как и convolution_lazy, считается корреляция (ядро не отражается)
+# и только по пикселям, где ядро целиком помещается в изображение.
+
+# с какого числа элементов ядра FFT выгоднее прямого сдвига-накопления
+FFT_MIN_TAPS = 49
+# до какой суммы kh + kw два одномерных прохода выгоднее FFT
+# (замеры benchmark_filters.py на кадрах 1080p)
+SEPARABLE_MAX_TAPS = 28
+
+
+# ядро ранга 1 считается разделимым, если второе сингулярное число
+# меньше первого в SEPARABLE_TOL раз и больше
+SEPARABLE_TOL = 1e-10
+
+# размер L2-кэша, под который подбираются плитки в filter_tiled (байт)
+L2_CACHE_BYTES = 2 << 20
+# полос на поток в filter_parallel — чтобы потоки заканчивали одновременно
+BANDS_PER_WORKER = 4
+
+
+def as_kernel(kernel):
+    """
+    Двумерное ядро; пара одномерных (col, row) задает разделимое
+    ядро np.outer(col, row).
+    """
+    if isinstance(kernel, tuple):
+        col, row = kernel
+        return np.outer(col, row)
+    return np.asarray(kernel, dtype=float)
+
+
+def separate_kernel(kernel):
+    """
+    Разложение ядра ранга 1 в пару (col, row), kernel == np.outer(col, row),
+    через SVD; None, если ядро не разделимо.
+    """
+    if isinstance(kernel, tuple):
+        col, row = kernel
+        return np.asarray(col, dtype=float), np.asarray(row, dtype=float)
+    kernel = np.asarray(kernel, dtype=float)
+    u, s, vt = np.linalg.svd(kernel)
+    if s[0] == 0 or (len(s) > 1 and s[1] > SEPARABLE_TOL * s[0]):
+        return None
+    scale = np.sqrt(s[0])
+    return u[:, 0] * scale, vt[0] * scale
+
+
+def _check(image, kernel):
+    image = np.asarray(image)
+    kernel = as_kernel(kernel)
+    if image.ndim != 2 or kernel.ndim != 2:
+        raise ValueError("Ожидаются двумерные изображение и ядро")
+    kh, kw = kernel.shape
+    if kh % 2 == 0 or kw % 2 == 0:
+        raise ValueError("Размеры ядра должны быть нечетными")
+    return image, kernel
+
+
+# бэкенды пишут в out, если он передан (массив (h - kh + 1) x (w - kw + 1)),
+# иначе создают результат сами. Счет идет в типе _work_dtype(image):
+# ядро приводится к нему же, иначе веса float64 подняли бы тип обратно
+
+def _work_dtype(image):
+    return np.float32 if image.dtype == np.float32 else float
+
+
+def correlate_direct(image, kernel, out=None):
+    # сумма сдвинутых копий изображения с весами ядра: K*K проходов по массиву
+    dtype = _work_dtype(image)
+    kernel = kernel.astype(dtype, copy=False)
+    h,w = image.shape
+    kh,kw = kernel.shape
+    oh,ow = h - kh + 1, w - kw + 1
+    if out is None:
+        out = np.zeros((oh, ow), dtype=dtype)
+    else:
+        out[...] = 0
+    for a in range(kh):
+        for b in range(kw):
+            weight = kernel[a, b]
+            if weight != 0:
+                out += weight * image[a:a + oh, b:b + ow]
+    return out
+
+
+def correlate_separable(image, kernel, out=None):
+    # два одномерных прохода: по строкам (kw сдвигов), затем по столбцам (kh)
+    parts = separate_kernel(kernel)
+    if parts is None:
+        raise ValueError("Ядро не разделимо (ранг больше 1)")
+    dtype = _work_dtype(image)
+    col, row = parts[0].astype(dtype, copy=False), parts[1].astype(dtype, copy=False)
+    h,w = image.shape
+    kh,kw = len(col), len(row)
+    oh,ow = h - kh + 1, w - kw + 1
+    rows = np.zeros((h, ow), dtype=dtype)
+    for b in range(kw):
+        if row[b] != 0:
+            rows += row[b] * image[:, b:b + ow]
+    if out is None:
+        out = np.zeros((oh, ow), dtype=dtype)
+    else:
+        out[...] = 0
+    for a in range(kh):
+        if col[a] != 0:
+            out += col[a] * rows[a:a + oh]
+    return out
+
+
+def _fast_len(n):
+    # ближайшая сверху длина вида 2^a * 3^b * 5^c — на ней FFT быстрее всего
+    best = 2 * n
+    p5 = 1
+    while p5 < best:
+        p35 = p5
+        while p35 < best:
+            p235 = p35
+            while p235 < n:
+                p235 *= 2
+            best = min(best, p235)
+            p35 *= 3
+        p5 *= 5
+    return best
+
+
+def correlate_fft(image, kernel, out=None):
+    h,w = image.shape
+    kh,kw = kernel.shape
+    shape = (_fast_len(h + kh - 1), _fast_len(w + kw - 1))
+    kernel = kernel.astype(_work_dtype(image), copy=False)
+    spectrum = np.fft.rfft2(image, shape) * np.fft.rfft2(kernel[::-1, ::-1], shape)
+    full = np.fft.irfft2(spectrum, shape)
+    if out is None:
+        return full[kh - 1:h, kw - 1:w]
+    out[...] = full[kh - 1:h, kw - 1:w]
+    return out
+
+
+BACKENDS = {
+    "direct": correlate_direct,
+    "fft": correlate_fft,
+    "separable": correlate_separable,
+}
+
+
+def choose_method(kernel, separable=None):
+    kh,kw = kernel.shape
+    if kh + kw <= SEPARABLE_MAX_TAPS:
+        if separable is None:
+            separable = separate_kernel(kernel) is not None
+        if separable:
+            return "separable"
+    return "fft" if kernel.size >= FFT_MIN_TAPS else "direct"
+
+
+def correlate_valid(image, kernel, method="auto", out=None):
+    """
+    Значения свёртки для всех внутренних пикселей сразу:
+    массив (h - kh + 1) x (w - kw + 1).
+    kernel — двумерное ядро или пара одномерных (col, row).
+    method: "direct", "fft", "separable" или "auto" (разделимое ядро —
+    двумя одномерными проходами, иначе по размеру ядра).
+    out — готовый массив под результат, в который пишет бэкенд.
+    """
+    source = kernel
+    image, kernel = _check(image, kernel)
+    if method == "auto":
+        method = choose_method(kernel, True if isinstance(source, tuple) else None)
+    if method not in BACKENDS:
+        raise ValueError("Неизвестный метод свёртки: %s" % method)
+    h,w = image.shape
+    kh,kw = kernel.shape
+    if h < kh or w < kw:
+        return np.zeros((max(h - kh + 1, 0), max(w - kw + 1, 0)))
+    if method == "separable":
+        # пара (col, row) передается как есть, без повторного разложения
+        kernel = source if isinstance(source, tuple) else kernel
+    # с out типа float32 счет идет во float32: вдвое меньше памяти на проход
+    dtype = np.float32 if out is not None and out.dtype == np.float32 else float
+    return BACKENDS[method](image.astype(dtype, copy=False), kernel, out)
+
+
+def _block_kernel(source, kernel, method):
+    # метод и ядро для свёртки по частям изображения: выбираются и
+    # раскладываются один раз на все изображение, а не на каждую часть
+    if method == "auto":
+        method = choose_method(kernel, True if isinstance(source, tuple) else None)
+    if method == "separable" and not isinstance(source, tuple):
+        return separate_kernel(kernel) or kernel, method
+    return source, method
+
+
+def filter_image(image, kernel, method="auto"):
+    """
+    То же, что apply_filter с итератором, обходящим все пиксели:
+    внутренние пиксели заменяются свёрткой, края остаются как были.
+    """
+    image, kernel2d = _check(image, kernel)
+    h,w = image.shape
+    kh,kw = kernel2d.shape
+    ph,pw = kh // 2, kw // 2
+    res = image.astype(float)
+    if h >= kh and w >= kw:
+        res[ph:h - ph, pw:w - pw] = correlate_valid(image, kernel, method)
+    return res
+
+
+def tile_size(kernel_shape, cache_bytes=L2_CACHE_BYTES):
+    """
+    Сторона квадратной плитки результата, при которой плитка с ореолом,
+    промежуточный массив и результат (три массива float64) помещаются
+    в cache_bytes.
+    """
+    kh,kw = kernel_shape
+    side = int(np.sqrt(cache_bytes / (3 * 8)))
+    return max(side - max(kh, kw) + 1, 1)
+
+
+def _tile_order(order, rows, cols):
+    # order — имя порядка из traversal.ORDERS или итератор (h, w) -> (i, j)
+    if isinstance(order, str):
+        return iterate_order(get_order(order, rows, cols), cols)
+    return order(rows, cols)
+
+
+def filter_tiled(image, kernel, order="linear", tile=None, method="auto"):
+    """
+    То же, что filter_image, но по плиткам: область результата делится
+    на плитки tile x tile (по умолчанию — tile_size, под L2-кэш), и каждая
+    плитка вместе с ореолом (kh - 1, kw - 1) сворачивается целиком.
+    order задает порядок обхода плиток: имя из traversal.ORDERS или
+    итератор как в main_func — функция (h, w), выдающая пары (i, j)
+    сетки плиток. Плитки, которые итератор не посетил, остаются как были.
+    tile — число или пара (th, tw).
+    """
+    source = kernel
+    image, kernel2d = _check(image, kernel)
+    h,w = image.shape
+    kh,kw = kernel2d.shape
+    ph,pw = kh // 2, kw // 2
+    res = image.astype(float)
+    if h < kh or w < kw:
+        return res
+    kernel, method = _block_kernel(source, kernel2d, method)
+    if tile is None:
+        tile = tile_size(kernel2d.shape)
+    th,tw = (tile, tile) if np.isscalar(tile) else tile
+    if th < 1 or tw < 1:
+        raise ValueError("Размер плитки должен быть положительным")
+    oh,ow = h - kh + 1, w - kw + 1
+    rows,cols = -(-oh // th), -(-ow // tw)
+    for i,j in _tile_order(order, rows, cols):
+        y0,x0 = i * th, j * tw
+        y1,x1 = min(y0 + th, oh), min(x0 + tw, ow)
+        block = image[y0:y1 + kh - 1, x0:x1 + kw - 1]
+        res[ph + y0:ph + y1, pw + x0:pw + x1] = correlate_valid(block, kernel, method)
+    return res
+
+
+def filter_parallel(image, kernel, workers=None, method="auto", out=None, dtype=np.float32):
+    """
+    То же, что filter_image, но полосами строк в пуле потоков (свёртки
+    numpy отпускают GIL). Полоса берется из изображения вместе с ореолом
+    (kh - 1 строк) как срез, без копирования, и сворачивается прямо в
+    свою часть out; края out копируются из изображения. Других копий
+    изображения нет.
+    out — готовый массив размера изображения (по умолчанию создается
+    с типом dtype); тип out — только вещественный: с float32 счет идет
+    во float32. workers — число потоков (по умолчанию по числу ядер).
+    """
+    source = kernel
+    image, kernel2d = _check(image, kernel)
+    h,w = image.shape
+    kh,kw = kernel2d.shape
+    ph,pw = kh // 2, kw // 2
+    if out is None:
+        out = np.empty((h, w), dtype=dtype)
+    elif out.shape != image.shape:
+        raise ValueError("Размер out не совпадает с размером изображения")
+    if out.dtype.kind != "f":
+        raise ValueError("out должен быть вещественным, а не %s" % out.dtype)
+    if h < kh or w < kw:
+        out[...] = image
+        return out
+    out[:ph] = image[:ph]
+    out[h - ph:] = image[h - ph:]
+    out[:, :pw] = image[:, :pw]
+    out[:, w - pw:] = image[:, w - pw:]
+
+    kernel, method = _block_kernel(source, kernel2d, method)
+    workers = workers or os.cpu_count() or 1
+    oh = h - kh + 1
+    bounds = np.linspace(0, oh, min(oh, workers * BANDS_PER_WORKER) + 1).astype(int).tolist()
+
+    def band(y0, y1):
+        correlate_valid(image[y0:y1 + kh - 1], kernel, method, out[ph + y0:ph + y1, pw:w - pw])
+
+    if workers == 1:
+        for y0, y1 in zip(bounds[:-1], bounds[1:]):
+            band(y0, y1)
+    else:
+        with ThreadPoolExecutor(workers) as pool:
+            list(pool.map(band, bounds[:-1], bounds[1:]))
+    return out
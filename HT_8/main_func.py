@@ -3,6 +3,10 @@ import numpy as np
 import copy
 from functools import partial
 
+from color_spaces import convert
+from convolution import as_kernel, filter_parallel, filter_tiled
+from traversal import hilbert_order, iterate_order, spiral_order, zigzag_order
+
 def gen_norm_hist(count):
     hist = [random.random() for i in range(count)]
     hist = np.array(hist)
@@ -72,52 +76,14 @@ def linear_iterator(h,w):
         for j in range(w):
             yield i,j
 
+# порядки обхода считаются один раз на размер (traversal), итераторы
+# только выдают готовые координаты
+
 def spiral_center_iterator(h,w):
-    total = h*w
-    seen = [[False]*w for _ in range(h)]
-    cx,cy = h//2, w//2
-    x,y = cx,cy
-    visited = 0
-    if 0 <= x < h and 0 <= y < w:
-        seen[x][y] = True
-        visited = 1
-        yield x,y
-    step = 1
-    dirs = [(0,1),(1,0),(0,-1),(-1,0)]
-    d = 0
-    while visited < total:
-        for _ in range(2):
-            dx,dy = dirs[d % 4]
-            for _ in range(step):
-                x += dx
-                y += dy
-                if 0 <= x < h and 0 <= y < w and not seen[x][y]:
-                    seen[x][y] = True
-                    visited += 1
-                    yield x,y
-                if visited >= total:
-                    break
-            d += 1
-            if visited >= total:
-                break
-        step += 1
+    yield from iterate_order(spiral_order(h,w), w)
 
 def zigzag_iterator(h,w):
-    for s in range(h + w - 1):
-        if s % 2 == 0:
-            i = min(s, h-1)
-            j = s - i
-            while i >= 0 and j < w:
-                yield i,j
-                i -= 1
-                j += 1
-        else:
-            j = min(s, w-1)
-            i = s - j
-            while j >= 0 and i < h:
-                yield i,j
-                i += 1
-                j -= 1
+    yield from iterate_order(zigzag_order(h,w), w)
 
 def hilbert_curve(x0, y0, xi, xj, yi, yj, n):
     if n <= 0:
@@ -131,24 +97,18 @@ def hilbert_curve(x0, y0, xi, xj, yi, yj, n):
         for p in hilbert_curve(x0+xi//2+yi,    y0+xj//2+yj,   -yi//2,-yj//2,-xi//2,-xj//2, n-1): yield p
 
 def peano_iterator(h,w):
-    if h != w:
-        raise ValueError("Peano iterator requires square image")
-    n = h
-    if n & (n - 1) != 0:
-        raise ValueError("Peano iterator requires size power of 2")
-    order = n.bit_length() - 1
-    for i,j in hilbert_curve(0,0,n,0,0,n,order):
-        yield i,j
+    # обход кривой Гильберта: для квадрата 2^k x 2^k — тот же, что
+    # hilbert_curve, для других размеров — обобщенная кривая Gilbert.
+    # Настоящая кривая Пеано — traversal.peano_order
+    yield from iterate_order(hilbert_order(h,w), w)
 
 
 # --------- перевод в оттенки серого (lambda) ---------
 
 def rgb_to_gray(image):
-    to_gray = lambda r,g,b: 0.299*r + 0.587*g + 0.114*b
-    r = image[:,:,0].astype(float)
-    g = image[:,:,1].astype(float)
-    b = image[:,:,2].astype(float)
-    return to_gray(r,g,b)
+    # 0.299*r + 0.587*g + 0.114*b (канал 0 — R) одним умножением на
+    # матрицу, без копий каналов; работает и для пачки кадров
+    return convert(image, "rgb", "gray")
 
 
 # --------- свёртка и фильтры ---------
@@ -164,12 +124,26 @@ def convolution_lazy(image, kernel, iterator):
         val = float((region * kernel).sum())
         yield i,j,val
 
-def apply_filter(image, iterator, kernel):
-    res = image.copy().astype(float)
+# итераторы, которые обходят все пиксели: для них порядок обхода
+# не влияет на результат и свёртка считается сразу по всему массиву
+FULL_COVERAGE_ITERATORS = {linear_iterator, spiral_center_iterator, zigzag_iterator, peano_iterator}
+
+def apply_filter(image, iterator, kernel, workers=None, out=None):
+    # полный обход считается полосами в пуле из workers потоков прямо в
+    # out (по умолчанию — новый float64, как у обхода по пикселям)
+    if iterator in FULL_COVERAGE_ITERATORS:
+        return filter_parallel(image, kernel, workers, out=out, dtype=float)
+    kernel = as_kernel(kernel)
+    res = np.empty(image.shape) if out is None else out
+    res[...] = image
     for i,j,val in convolution_lazy(image, kernel, iterator):
         res[i,j] = val
     return res
 
+def apply_filter_tiled(image, iterator, kernel, tile=None):
+    # итератор задает порядок обхода не пикселей, а плиток под L2-кэш
+    return filter_tiled(image, kernel, iterator, tile)
+
 def gaussian_kernel(size, sigma):
     ax = np.arange(-(size // 2), size // 2 + 1)
     xx,yy = np.meshgrid(ax, ax)
@@ -177,6 +151,14 @@ def gaussian_kernel(size, sigma):
     kernel /= kernel.sum()
     return kernel
 
+def gaussian_kernel_1d(size, sigma):
+    # gaussian_kernel(size, sigma) == np.outer(g, g): ядро можно передать
+    # как пару (g, g) и фильтровать двумя одномерными проходами
+    ax = np.arange(-(size // 2), size // 2 + 1)
+    kernel = np.exp(-(ax**2) / (2 * sigma**2))
+    kernel /= kernel.sum()
+    return kernel
+
 def mse(a,b):
     diff = a.astype(float) - b.astype(float)
     return float((diff * diff).mean())
@@ -205,3 +187,6 @@ if __name__ == '__main__':
     res_gauss_linear = gauss_filter(img_gray, linear_iterator)
     res_gauss_spiral = gauss_filter(img_gray, spiral_center_iterator)
     print("MSE gaussian linear/spiral:", mse(res_gauss_linear, res_gauss_spiral))
+
+    res_gauss_tiled = apply_filter_tiled(img_gray, peano_iterator, gauss_kernel, tile=2)
+    print("MSE gaussian linear/tiled peano:", mse(res_gauss_linear, res_gauss_tiled))
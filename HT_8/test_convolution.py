@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from convolution import correlate_direct, correlate_fft, correlate_separable, filter_image, filter_parallel
+from main_func import gaussian_kernel, gaussian_kernel_1d
+
+
+def make_image():
+    return np.random.default_rng(0).integers(0, 256, (64, 80)).astype(np.uint8)
+
+
+@pytest.mark.parametrize("kernel", [gaussian_kernel(5, 1.0),
+                                    (gaussian_kernel_1d(7, 1.0), gaussian_kernel_1d(7, 1.0)),
+                                    np.ones((9, 9)) / 81])
+@pytest.mark.parametrize("workers", [1, 3])
+def test_filter_parallel_float_out(kernel, workers):
+    image = make_image()
+    expected = filter_image(image, kernel)
+    out64 = np.empty(image.shape)
+    assert filter_parallel(image, kernel, workers, out=out64) is out64
+    assert np.allclose(out64, expected)
+    out32 = np.empty(image.shape, dtype=np.float32)
+    assert filter_parallel(image, kernel, workers, out=out32) is out32
+    assert np.allclose(out32, expected, atol=1e-3)
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.int32])
+def test_filter_parallel_rejects_integer_out(dtype):
+    image = make_image()
+    with pytest.raises(ValueError):
+        filter_parallel(image, gaussian_kernel(5, 1.0), out=np.empty(image.shape, dtype=dtype))
+    with pytest.raises(ValueError):
+        filter_parallel(image, gaussian_kernel(5, 1.0), dtype=dtype)
+
+
+def test_filter_parallel_rejects_wrong_shape():
+    image = make_image()
+    with pytest.raises(ValueError):
+        filter_parallel(image, gaussian_kernel(5, 1.0), out=np.empty((10, 10), dtype=np.float32))
+
+
+@pytest.mark.parametrize("backend", [correlate_direct, correlate_fft, correlate_separable])
+def test_float32_backends_compute_in_float32(backend):
+    image = make_image().astype(np.float32)
+    result = backend(image, gaussian_kernel(5, 1.0))
+    assert result.dtype == np.float32
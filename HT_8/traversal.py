@@ -0,0 +1,279 @@
+from functools import lru_cache
+
+import numpy as np
+
+
+# --------- порядки обхода изображения как массивы индексов ---------
+# Порядок для размера (h, w) — массив int32 плоских индексов i*w + j
+# длины h*w (только для чтения). Каждый порядок считается один раз на
+# размер и хранится в LRU-кэше на TRAVERSAL_CACHE_SIZE размеров.
+
+TRAVERSAL_CACHE_SIZE = 16
+
+
+def _frozen(order):
+    order = np.ascontiguousarray(order, dtype=np.int32)
+    order.flags.writeable = False
+    return order
+
+
+@lru_cache(maxsize=TRAVERSAL_CACHE_SIZE)
+def linear_order(h, w):
+    return _frozen(np.arange(h * w))
+
+
+@lru_cache(maxsize=TRAVERSAL_CACHE_SIZE)
+def spiral_order(h, w):
+    # спираль из центра (h//2, w//2): вправо, вниз, влево, вверх с длинами
+    # отрезков 1, 1, 2, 2, 3, 3, ...; от каждого отрезка берется часть
+    # внутри изображения, сами пиксели отрезка считаются векторно
+    total = h * w
+    if total == 0:
+        return _frozen(np.zeros(0))
+    x,y = h // 2, w // 2
+    parts = [np.array([x * w + y])]
+    visited = 1
+    dirs = [(0,1),(1,0),(0,-1),(-1,0)]
+    segment = 0
+    while visited < total:
+        dx,dy = dirs[segment % 4]
+        step = segment // 2 + 1
+        if dx == 0:
+            # горизонтальный отрезок по строке x: столбцы y+dy, ..., y+dy*step
+            if 0 <= x < h:
+                lo,hi = (y + 1, y + step) if dy > 0 else (y - step, y - 1)
+                lo,hi = max(lo, 0), min(hi, w - 1)
+                if lo <= hi:
+                    cols = np.arange(lo, hi + 1) if dy > 0 else np.arange(hi, lo - 1, -1)
+                    parts.append(x * w + cols)
+                    visited += hi - lo + 1
+        else:
+            if 0 <= y < w:
+                lo,hi = (x + 1, x + step) if dx > 0 else (x - step, x - 1)
+                lo,hi = max(lo, 0), min(hi, h - 1)
+                if lo <= hi:
+                    rows = np.arange(lo, hi + 1) if dx > 0 else np.arange(hi, lo - 1, -1)
+                    parts.append(rows * w + y)
+                    visited += hi - lo + 1
+        x,y = x + dx * step, y + dy * step
+        segment += 1
+    return _frozen(np.concatenate(parts))
+
+
+@lru_cache(maxsize=TRAVERSAL_CACHE_SIZE)
+def zigzag_order(h, w):
+    # по антидиагоналям s = i + j; на четных i убывает, на нечетных растет
+    i,j = np.divmod(np.arange(h * w), w)
+    s = i + j
+    return _frozen(np.lexsort((np.where(s % 2 == 0, -i, i), s)))
+
+
+def _hilbert_square(n):
+    # кривая Гильберта для квадрата 2^k x 2^k в той же ориентации, что
+    # main_func.hilbert_curve; номер точки d переводится в (i, j) по битам
+    t = np.arange(n * n, dtype=np.int64)
+    i = np.zeros_like(t)
+    j = np.zeros_like(t)
+    s = 1
+    while s < n:
+        rx = 1 & (t // 2)
+        ry = 1 & (t ^ rx)
+        turn = ry == 0
+        flip = turn & (rx == 1)
+        i[flip] = s - 1 - i[flip]
+        j[flip] = s - 1 - j[flip]
+        i[turn], j[turn] = j[turn], i[turn]
+        i += s * ry
+        j += s * rx
+        t //= 4
+        s *= 2
+    return i * n + j
+
+
+def _expand_runs(x, y, lengths, dx, dy):
+    # отрезки (начало, длина, шаг) -> все их точки подряд
+    offsets = np.arange(int(lengths.sum())) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return (np.repeat(x, lengths) + offsets * np.repeat(dx, lengths),
+            np.repeat(y, lengths) + offsets * np.repeat(dy, lengths))
+
+
+def _gilbert(h, w):
+    # обобщенная кривая Гильберта (Gilbert, J. Červený) для любого
+    # прямоугольника. Вместо рекурсии все области одного уровня делятся
+    # сразу, векторно: область (x, y, a, b) — угол, главная и поперечная
+    # оси. Области-отрезки откладываются вместе с ключом — номером пути
+    # в дереве деления (по 2 бита на уровень), по которому в конце
+    # восстанавливается порядок обхода
+    if w >= h:
+        regions = [0, 0, w, 0, 0, h]
+    else:
+        regions = [0, 0, 0, h, w, 0]
+    x, y, ax, ay, bx, by = (np.array([v], dtype=np.int64) for v in regions)
+    key = np.zeros(1, dtype=np.int64)
+    leaves = []
+    depth = 0
+    while len(x):
+        width = np.abs(ax + ay)
+        height = np.abs(bx + by)
+        leaf = (width == 1) | (height == 1)
+        if leaf.any():
+            leaves.append((depth, [v[leaf] for v in (x, y, ax, ay, bx, by, key)]))
+            x, y, ax, ay, bx, by, key, width, height = (
+                v[~leaf] for v in (x, y, ax, ay, bx, by, key, width, height))
+        if not len(x):
+            break
+        dax, day, dbx, dby = np.sign(ax), np.sign(ay), np.sign(bx), np.sign(by)
+        ax2, ay2, bx2, by2 = ax // 2, ay // 2, bx // 2, by // 2
+        long = 2 * width > 3 * height
+        split = ~long
+        # предпочитаем четное число шагов
+        even = long & (np.abs(ax2 + ay2) % 2 == 1) & (width > 2)
+        ax2, ay2 = ax2 + even * dax, ay2 + even * day
+        even = split & (np.abs(bx2 + by2) % 2 == 1) & (height > 2)
+        bx2, by2 = bx2 + even * dbx, by2 + even * dby
+
+        children = []
+        for mask, parts in (
+                (long, [(x, y, ax2, ay2, bx, by),
+                        (x + ax2, y + ay2, ax - ax2, ay - ay2, bx, by)]),
+                (split, [(x, y, bx2, by2, ax2, ay2),
+                         (x + bx2, y + by2, ax, ay, bx - bx2, by - by2),
+                         (x + (ax - dax) + (bx2 - dbx), y + (ay - day) + (by2 - dby),
+                          -bx2, -by2, -(ax - ax2), -(ay - ay2))])):
+            for index, child in enumerate(parts):
+                children.append([v[mask] for v in child] + [key[mask] * 4 + index])
+        x, y, ax, ay, bx, by, key = (np.concatenate(field) for field in zip(*children))
+        depth += 1
+
+    if 2 * depth > 62:
+        raise ValueError("Слишком большое изображение для кривой Гильберта")
+    x, y, ax, ay, bx, by, key = (
+        np.concatenate([leaf[k] << (2 * (depth - level)) if k == 6 else leaf[k]
+                        for level, leaf in leaves]) for k in range(7))
+    row = np.abs(bx + by) == 1
+    lengths = np.where(row, np.abs(ax + ay), np.abs(bx + by))
+    dx = np.where(row, np.sign(ax), np.sign(bx))
+    dy = np.where(row, np.sign(ay), np.sign(by))
+    order = np.argsort(key, kind="stable")
+    cols, rows = _expand_runs(x[order], y[order], lengths[order], dx[order], dy[order])
+    return rows * w + cols
+
+
+@lru_cache(maxsize=TRAVERSAL_CACHE_SIZE)
+def hilbert_order(h, w):
+    """
+    Кривая Гильберта для любого прямоугольника: для квадрата 2^k x 2^k —
+    та же, что main_func.hilbert_curve, для остальных размеров —
+    обобщенная кривая Gilbert (соседние точки смежны; при некоторых
+    сочетаниях четности сторон возможен один диагональный шаг).
+    """
+    if h * w == 0:
+        return _frozen(np.zeros(0))
+    if h == w and h & (h - 1) == 0:
+        return _frozen(_hilbert_square(h))
+    return _frozen(_gilbert(h, w))
+
+
+# порядок обхода блоков 3 x 3 кривой Пеано: (столбец, строка), змейкой
+_PEANO_BLOCKS = [(0,0),(0,1),(0,2),(1,2),(1,1),(1,0),(2,0),(2,1),(2,2)]
+
+
+def _thirds(size):
+    # деление на три почти равные части: начала и длины
+    base, extra = size // 3, size % 3
+    lengths = [base + (extra > 0), base + (extra > 1), base]
+    return [np.zeros_like(size), lengths[0], lengths[0] + lengths[1]], lengths
+
+
+@lru_cache(maxsize=TRAVERSAL_CACHE_SIZE)
+def peano_order(h, w):
+    """
+    Кривая Пеано: области рекурсивно делятся на 3 x 3 блока, которые
+    обходятся змейкой с отражениями. Для квадрата 3^k x 3^k это
+    классическая кривая Пеано (соседние точки смежны); для других
+    размеров блоки делятся на почти равные трети, и на стыках блоков
+    возможны короткие скачки. Деление идет по уровням, векторно.
+    """
+    if h * w == 0:
+        return _frozen(np.zeros(0))
+    # область: угол (x0, y0), размеры (rw, rh), отражения по x и y
+    x0, y0 = np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    rw, rh = np.array([w], dtype=np.int64), np.array([h], dtype=np.int64)
+    fx, fy = np.zeros(1, dtype=bool), np.zeros(1, dtype=bool)
+    while (rw > 1).any() or (rh > 1).any():
+        col_start, col_len = _thirds(rw)
+        row_start, row_len = _thirds(rh)
+        children = []
+        for c, r in _PEANO_BLOCKS:
+            # (c, r) — блок в локальных координатах области, с учетом отражений
+            cx = np.where(fx, col_start[2 - c], col_start[c])
+            cy = np.where(fy, row_start[2 - r], row_start[r])
+            cw = np.where(fx, col_len[2 - c], col_len[c])
+            ch = np.where(fy, row_len[2 - r], row_len[r])
+            children.append((x0 + cx, y0 + cy, cw, ch, fx ^ (r % 2 == 1), fy ^ (c % 2 == 1)))
+        # дети одной области идут подряд: склеиваем по оси блоков
+        fields = [np.stack([child[k] for child in children], axis=1).reshape(-1)
+                  for k in range(6)]
+        keep = (fields[2] > 0) & (fields[3] > 0)
+        x0, y0, rw, rh, fx, fy = (field[keep] for field in fields)
+    return _frozen(y0 * w + x0)
+
+
+ORDERS = {
+    "linear": linear_order,
+    "spiral": spiral_order,
+    "zigzag": zigzag_order,
+    "hilbert": hilbert_order,
+    "peano": peano_order,
+}
+
+
+def get_order(name, h, w):
+    if name not in ORDERS:
+        raise ValueError("Неизвестный порядок обхода: %s" % name)
+    return ORDERS[name](h, w)
+
+
+def order_coords(order, w):
+    """
+    Координаты (rows, cols) точек порядка.
+    """
+    return np.divmod(order, w)
+
+
+def iterate_order(order, w, chunk_size=65536):
+    """
+    Итератор пар (i, j) — как у итераторов обхода main_func. Пары
+    строятся частями по chunk_size, а не списками на весь порядок.
+    """
+    for rows, cols in iterate_chunks(order, w, chunk_size):
+        yield from zip(rows.tolist(), cols.tolist())
+
+
+def iterate_chunks(order, w, chunk_size=65536):
+    """
+    Порядок частями: пары массивов (rows, cols) не длиннее chunk_size.
+    """
+    for start in range(0, len(order), chunk_size):
+        yield order_coords(order[start:start + chunk_size], w)
+
+
+def gather(image, order):
+    """
+    Пиксели image в порядке обхода одной операцией: массив длины h*w
+    (для многоканального изображения — h*w x C).
+    """
+    h,w = image.shape[:2]
+    return image.reshape(h * w, *image.shape[2:])[order]
+
+
+def scatter(values, order, shape):
+    """
+    Обратно к gather: изображение shape, в котором пиксель order[k]
+    равен values[k].
+    """
+    values = np.asarray(values)
+    h,w = shape[:2]
+    image = np.empty((h * w,) + values.shape[1:], dtype=values.dtype)
+    image[order] = values
+    return image.reshape(shape)